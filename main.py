@@ -1,11 +1,215 @@
+import argparse
+import asyncio
+import json
+import random
+import signal
+import sys
+from contextlib import nullcontext
+
+from src import bench
+from src.async_game import terminal_loop
 from src.elements import *
 from src.game import *
+from src.loadgen import run_load
+from src.profiling import instrumentation, profile_session
+from src.replay import ReplayRecorder, verify_files
+from src.server import GameServer, SessionLimits
+from src.simulate import POLICIES, simulate
+from src.stats import aggregate_replays, aggregate_simulation
 
 
 def main() -> None:
-    game = ConcreteGameFactory.create_new_game()
-    game_loop = GameLoop(game)
-    game_loop.run_game_loop()
+    args = parse_args()
+    if args.stats_json:
+        instrumentation.enable(export_path=args.stats_json)
+        if hasattr(signal, "SIGUSR1"):
+            # kill -USR1 <pid> writes the summary without stopping the game
+            signal.signal(
+                signal.SIGUSR1, lambda *_: instrumentation.save(args.stats_json)
+            )
+    profiling = profile_session(args.cprofile) if args.cprofile else nullcontext()
+    with profiling:
+        run_command(args)
+
+
+def run_command(args: argparse.Namespace) -> None:
+    if args.command == "simulate":
+        run_simulation(args)
+        return
+    if args.command == "bench":
+        run_benchmarks(args)
+        return
+    if args.command == "serve":
+        asyncio.run(run_server(args))
+        return
+    if args.command == "loadgen":
+        report = asyncio.run(run_load(args.host, args.port, args.sessions, args.moves))
+        if args.json:
+            print(json.dumps(report.to_dict(), indent=2))
+        else:
+            report.render()
+        return
+    if args.command == "replay":
+        run_replay(args)
+        return
+    run_game(args)
+
+
+def run_game(args: argparse.Namespace) -> None:
+    recorder = None
+    if args.record:
+        # the seed is needed to replay the game, so pick it explicitly
+        seed = random.getrandbits(63)
+        game = ConcreteGameFactory.create_new_game(seed=seed)
+        recorder = ReplayRecorder(args.record, game)
+        game.set_recorder(recorder)
+    else:
+        game = ConcreteGameFactory.create_new_game()
+    if args.compact_view:
+        game.get_game_board().set_glyph_mode(GlyphMode.COMPACT)
+    elif args.no_color:
+        game.get_game_board().set_glyph_mode(GlyphMode.PLAIN)
+    try:
+        if args.use_async:
+            terminal_loop(game, args.frame_delay).run_game_loop()
+        else:
+            GameLoop(game).run_game_loop()
+    finally:
+        if recorder is not None:
+            recorder.close(game.get_game_score().get_points().value)
+
+
+def run_simulation(args: argparse.Namespace) -> None:
+    run = aggregate_simulation if args.stats else simulate
+    report = run(
+        args.games,
+        policy=args.policy,
+        master_seed=args.seed,
+        workers=args.workers,
+        max_moves=args.max_moves,
+    )
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        report.render()
+
+
+def run_benchmarks(args: argparse.Namespace) -> None:
+    scenarios = bench.default_scenarios(tuple(args.sizes))
+    if args.only:
+        scenarios = [s for s in scenarios if s.name in args.only]
+    report = bench.run_benchmarks(scenarios, args.min_time, progress=True)
+    if args.out:
+        bench.save_results(report, args.out)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print("\nSpeedup against", args.compare)
+        for line in bench.compare_results(baseline, report):
+            print(line)
+
+
+def run_replay(args: argparse.Namespace) -> None:
+    if args.stats:
+        stats = aggregate_replays(args.files, args.workers)
+        if args.json:
+            print(json.dumps(stats.to_dict(), indent=2))
+        else:
+            stats.render()
+        return
+    report = verify_files(args.files, args.workers)
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+    else:
+        report.render()
+    if not report.is_ok():
+        sys.exit(1)
+
+
+async def run_server(args: argparse.Namespace) -> None:
+    limits = SessionLimits(rate=args.rate, idle_timeout=args.idle_timeout)
+    server = GameServer(args.host, args.port, limits, args.max_sessions, args.seed)
+    await server.start()
+    print(f"Listening on {args.host}:{server.get_port()}")
+    await server.serve_forever()
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Match-three CLI")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="interactive game on the asyncio loop (input while animating skips it)",
+    )
+    parser.add_argument(
+        "--frame-delay", type=float, default=1.0, help="seconds per animation frame"
+    )
+    parser.add_argument(
+        "--stats-json",
+        metavar="PATH",
+        help="time board and cascade phases, write the summary here on exit "
+        "(or on SIGUSR1); simulate workers are not covered",
+    )
+    parser.add_argument(
+        "--cprofile", metavar="PATH", help="save a cProfile capture of the session"
+    )
+    parser.add_argument(
+        "--record", metavar="PATH", help="append the seed and every command here"
+    )
+    parser.add_argument(
+        "--no-color", action="store_true", help="draw the board without ANSI colors"
+    )
+    parser.add_argument(
+        "--compact-view",
+        action="store_true",
+        help="draw the board as plain letters without the grid",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    sim = subparsers.add_parser("simulate", help="play many games without UI")
+    sim.add_argument("--games", type=int, default=1000)
+    sim.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    sim.add_argument("--seed", type=int, default=0, help="master seed")
+    sim.add_argument("--workers", type=int, default=1)
+    sim.add_argument("--max-moves", type=int, default=100)
+    sim.add_argument("--json", action="store_true", help="print report as JSON")
+    sim.add_argument(
+        "--stats", action="store_true", help="per-move statistics instead of scores"
+    )
+
+    bench_parser = subparsers.add_parser("bench", help="benchmark hot paths")
+    bench_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(bench.DEFAULT_SIZES)
+    )
+    bench_parser.add_argument("--only", nargs="+", help="scenario names to run")
+    bench_parser.add_argument("--min-time", type=float, default=0.2)
+    bench_parser.add_argument("--out", help="save results as JSON")
+    bench_parser.add_argument("--compare", help="baseline JSON to compare with")
+
+    serve = subparsers.add_parser("serve", help="TCP game server (line protocol)")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=7777)
+    serve.add_argument("--max-sessions", type=int, default=10_000)
+    serve.add_argument("--rate", type=float, default=50.0, help="commands/s")
+    serve.add_argument("--idle-timeout", type=float, default=300.0)
+    serve.add_argument("--seed", type=int, help="seed of the first game")
+
+    load = subparsers.add_parser("loadgen", help="load test a running server")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=7777)
+    load.add_argument("--sessions", type=int, default=100)
+    load.add_argument("--moves", type=int, default=20)
+    load.add_argument("--json", action="store_true", help="print report as JSON")
+
+    replay = subparsers.add_parser("replay", help="verify recorded games")
+    replay.add_argument("files", nargs="+", help="logs written with --record")
+    replay.add_argument("--workers", type=int, help="processes (default: all CPUs)")
+    replay.add_argument("--json", action="store_true", help="print report as JSON")
+    replay.add_argument(
+        "--stats", action="store_true", help="per-move statistics of the games"
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
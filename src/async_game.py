@@ -0,0 +1,195 @@
+"""
+Игровой цикл на asyncio: ввод не блокирует цикл событий, кадры анимации
+планируются через asyncio.sleep, поэтому в одном процессе одновременно
+могут идти несколько игр (а также таймеры и боты).
+"""
+
+import asyncio
+import io
+import sys
+import threading
+from contextlib import redirect_stdout
+from typing import Awaitable, Callable
+
+from .elements import FrameRenderer
+from .game import (
+    AbsGameLoop,
+    CommandDispatcher,
+    EndGameCommand,
+    Game,
+    HintCommand,
+    InvalidCommand,
+    MoveCommand,
+)
+from .render import TerminalRenderer
+
+# источник команд игрока: очередная строка или None (ввод закончился)
+InputSource = Callable[[], Awaitable[str | None]]
+
+PROMPT = (
+    'Enter command ("11,12" or "10:12,11:12" to swap, b1 45 - use bonus 1 on cell 45,'
+    " u - undo, h - hint, q - quit): "
+)
+
+
+async def read_stdin() -> str | None:
+    """
+    строка из стандартного ввода в отдельном потоке; поток фоновый
+    (daemon), поэтому незаконченное чтение не задерживает выход из игры
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future[str] = loop.create_future()
+
+    def resolve(line: str) -> None:
+        if not future.done():
+            future.set_result(line)
+
+    def read() -> None:
+        line = sys.stdin.readline()
+        try:
+            loop.call_soon_threadsafe(resolve, line)
+        except RuntimeError:
+            # the event loop is already closed
+            pass
+
+    threading.Thread(target=read, daemon=True).start()
+    line = await future
+    return line if line else None
+
+
+class AsyncGameLoop(AbsGameLoop):
+    """
+    класс реализации
+    игровой цикл одной игры внутри цикла событий asyncio
+    """
+
+    def __init__(
+        self,
+        game: Game,
+        read_line: InputSource | None = None,
+        renderer: FrameRenderer | None = None,
+        frame_delay: float = 1.0,
+        animate: bool = True,
+    ) -> None:
+        """
+        renderer - None: игра без вывода (боты, тесты)
+        animate - False: ходы выполняются без кадров анимации
+        """
+        super().__init__(game)
+        self._read_line = read_line if read_line is not None else read_stdin
+        self._renderer = renderer
+        self._frame_delay = frame_delay
+        self._animate = animate
+        self._commands: asyncio.Queue[str | None] = asyncio.Queue()
+        # установлен, если анимацию текущего хода нужно пропустить
+        self._skip = asyncio.Event()
+        self._animating = False
+        self._running = False
+
+    def run_game_loop(self):
+        asyncio.run(self.run())
+
+    # command
+    async def run(self) -> None:
+        """
+        post: цикл завершён командой "q" или окончанием ввода
+        """
+        self._running = True
+        reader = asyncio.create_task(self._read_commands())
+        try:
+            while self._running:
+                if self._renderer is not None:
+                    self._draw(self._status_text() + PROMPT)
+                command = await self._commands.get()
+                if command is None:
+                    break
+                await self.handle_command(command)
+        finally:
+            reader.cancel()
+            self._running = False
+
+    async def handle_command(self, command: str) -> None:
+        """
+        post: команда выполнена; кадры хода выведены с паузами frame_delay
+        """
+        cmd = CommandDispatcher(command, self._game).process_command()
+        if isinstance(cmd, EndGameCommand):
+            self._running = False
+        elif isinstance(cmd, MoveCommand):
+            await self._play_move(cmd, command)
+        elif isinstance(cmd, HintCommand):
+            # the search is CPU bound, keep the event loop responsive
+            await asyncio.to_thread(cmd.execute)
+        elif isinstance(cmd, InvalidCommand):
+            await self._show_message(cmd.get_message())
+        else:
+            cmd.execute()
+
+    def skip_animation(self) -> None:
+        """
+        post: текущий ход доигрывается без пауз
+        """
+        if self._animating:
+            self._skip.set()
+
+    async def _read_commands(self) -> None:
+        while True:
+            line = await self._read_line()
+            command = line.strip().lower() if line is not None else None
+            await self._commands.put(command)
+            # nothing is read after the game ends
+            if command is None or command == "q":
+                return
+            # typing ahead while a move is animated skips the rest of it
+            self.skip_animation()
+
+    async def _play_move(self, cmd: MoveCommand, command: str) -> None:
+        self._skip.clear()
+        self._animating = True
+        try:
+            for redraw in cmd.iter_frames():
+                if not self._animate or self._skip.is_set():
+                    continue
+                if redraw:
+                    self._draw()
+                await self._wait_frame()
+        finally:
+            self._animating = False
+        if cmd.get_error() is not None:
+            message = InvalidCommand(command, cmd.get_error()).get_message()
+            await self._show_message(message)
+        elif cmd.is_reshuffled():
+            await self._show_message("No moves left, the board was reshuffled")
+
+    async def _wait_frame(self) -> None:
+        try:
+            await asyncio.wait_for(self._skip.wait(), self._frame_delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _show_message(self, message: str) -> None:
+        if self._renderer is None:
+            return
+        print(message)
+        await asyncio.sleep(self._frame_delay)
+
+    def _draw(self, footer: str | None = None) -> None:
+        if self._renderer is not None:
+            self._renderer.draw(self._game.get_game_board(), footer)
+
+    def _status_text(self) -> str:
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            self._game.render_status()
+        return buffer.getvalue()
+
+    # query
+    def is_running(self) -> bool:
+        return self._running
+
+
+def terminal_loop(game: Game, frame_delay: float = 1.0) -> AsyncGameLoop:
+    """
+    асинхронный цикл для игры в терминале
+    """
+    return AsyncGameLoop(game, read_stdin, TerminalRenderer(), frame_delay)
@@ -0,0 +1,205 @@
+"""
+Пакетный движок: K независимых досок в одном массиве (K, rows, cols).
+Обмен, поиск комбинаций, сдвиг и заполнение выполняются сразу для всех
+досок операциями NumPy. Результат совпадает с CombHandler для каждой
+доски с тем же seed: новые элементы берутся из PieceRNG доски
+в том же порядке (построчно, один draw на шаг каскада).
+"""
+
+from typing import NamedTuple, Sequence
+
+from . import bitboard, matcher
+from .elements import ZOBRIST_CODES, CompactBoard, PieceEnum
+from .moves import Swap, reshuffle
+from .rng import PieceRNG
+
+np = matcher.np
+
+# очки за комбинацию по её длине (как Combination.get_score_points)
+_POINTS = (0, 0, 0, 3, 5, 9, 15)
+
+
+class BatchStep(NamedTuple):
+    """
+    класс реализации
+    результат одного пакетного хода для каждой доски
+    """
+
+    # очки, набранные за ход
+    points: "np.ndarray"
+    # количество шагов каскада (как len(CombHandler.process_combs()))
+    cascades: "np.ndarray"
+
+
+class BatchEngine:
+    """
+    класс реализации
+    K досок одного размера, обрабатываемых вместе
+    """
+
+    def __init__(self, codes: "np.ndarray", rngs: Sequence[PieceRNG]) -> None:
+        """
+        pre : NumPy установлен
+        pre : codes - массив (K, rows, cols), len(rngs) == K
+        """
+        if not matcher.HAS_NUMPY:
+            raise RuntimeError("BatchEngine requires NumPy")
+        self._codes = np.array(codes, dtype=np.uint8)
+        if self._codes.ndim != 3 or len(rngs) != self._codes.shape[0]:
+            raise ValueError("codes must be (K, rows, cols) with one rng per board")
+        self._rngs = list(rngs)
+        self._scores = np.zeros(len(self._rngs), dtype=np.int64)
+
+    @classmethod
+    def from_seeds(
+        cls, seeds: Sequence[int], rows: int = 8, cols: int = 8
+    ) -> "BatchEngine":
+        """
+        доски, совпадающие с ConcreteGameFactory.create_new_game(seed=...),
+        включая перемешивание досок без допустимого хода
+        """
+        rngs = [PieceRNG(seed) for seed in seeds]
+        cells = b"".join(rng.draw(rows * cols) for rng in rngs)
+        codes = np.frombuffer(cells, dtype=np.uint8).reshape(len(rngs), rows, cols)
+        engine = cls(codes, rngs)
+        engine.prepare()
+        engine.reshuffle_dead()
+        return engine
+
+    # command
+    def prepare(self) -> None:
+        """
+        post: на досках нет комбинаций (как CombHandler.prepare_board)
+        """
+        while True:
+            mask, _ = _find_matches(self._codes)
+            if not mask.any():
+                return
+            self._refill(mask)
+
+    def reshuffle_dead(self) -> None:
+        """
+        post: доски без допустимого хода перемешаны (как moves.reshuffle
+              с PieceRNG доски)
+        """
+        _, rows, cols = self._codes.shape
+        for k in range(len(self._rngs)):
+            cells = self._codes[k].tobytes()
+            masks = bitboard.masks_from_codes(cells, rows, cols, ZOBRIST_CODES)
+            if any(bitboard.move_targets(mask, rows, cols) for mask in masks):
+                continue
+            # dead boards are rare: reuse the scalar reshuffle on a scratch
+            # board that draws from this board's generator
+            board = CompactBoard(rows, cols, PieceRNG(0))
+            board.load_codes(cells)
+            board.set_rng(self._rngs[k])
+            reshuffle(board)
+            self._codes[k] = np.frombuffer(board.dump_codes(), dtype=np.uint8).reshape(
+                rows, cols
+            )
+
+    def step(self, swaps: Sequence[Swap | None]) -> BatchStep:
+        """
+        pre : len(swaps) == K; None - доска пропускает ход
+        post: обмены выполнены, каскады обработаны на всех досках
+        """
+        count = len(self._rngs)
+        if len(swaps) != count:
+            raise ValueError(f"Expected {count} swaps, got {len(swaps)}")
+        active = [k for k, swap in enumerate(swaps) if swap is not None]
+        if active:
+            k = np.array(active)
+            (r1, c1), (r2, c2) = np.array([swaps[i] for i in active]).transpose(1, 2, 0)
+            grid = self._codes
+            grid[k, r1, c1], grid[k, r2, c2] = grid[k, r2, c2], grid[k, r1, c1]
+
+        points = np.zeros(count, dtype=np.int64)
+        cascades = np.zeros(count, dtype=np.int64)
+        while True:
+            mask, step_points = _find_matches(self._codes)
+            matched = mask.any(axis=(1, 2))
+            if not matched.any():
+                break
+            self._codes[mask] = PieceEnum.X.value
+            self._apply_gravity()
+            self._refill(self._codes == PieceEnum.X.value)
+            points += step_points
+            cascades += matched
+        self._scores += points
+        return BatchStep(points, cascades)
+
+    def _apply_gravity(self) -> None:
+        # a stable sort on "is not empty" moves empty cells to the top of
+        # every column and keeps the order of the remaining pieces
+        filled = self._codes != PieceEnum.X.value
+        order = np.argsort(filled, axis=1, kind="stable")
+        self._codes = np.take_along_axis(self._codes, order, axis=1)
+
+    def _refill(self, mask: "np.ndarray") -> None:
+        # nonzero() walks boards in order and each board row by row,
+        # which is the order CombHandler draws new pieces in
+        k, r, c = np.nonzero(mask)
+        counts = np.bincount(k, minlength=len(self._rngs)).tolist()
+        drawn = b"".join(rng.draw(n) for rng, n in zip(self._rngs, counts) if n)
+        self._codes[k, r, c] = np.frombuffer(drawn, dtype=np.uint8)
+
+    # query
+    def get_codes(self) -> "np.ndarray":
+        return self._codes
+
+    def get_board_codes(self, index: int) -> bytes:
+        return self._codes[index].tobytes()
+
+    def get_scores(self) -> "np.ndarray":
+        return self._scores
+
+    def get_rngs(self) -> list[PieceRNG]:
+        return self._rngs
+
+    def __len__(self) -> int:
+        return len(self._rngs)
+
+
+def _find_matches(grid: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+    """
+    клетки всех рядов из 3 и более одинаковых элементов и очки каждой доски
+    """
+    boards, rows, cols = grid.shape
+    points = np.zeros(boards, dtype=np.int64)
+    row_mask = _run_mask(grid.reshape(boards * rows, cols), rows, points)
+    col_mask = _run_mask(
+        grid.transpose(0, 2, 1).reshape(boards * cols, rows), cols, points
+    )
+    mask = row_mask.reshape(boards, rows, cols)
+    mask |= col_mask.reshape(boards, cols, rows).transpose(0, 2, 1)
+    return mask, points
+
+
+def _run_mask(lines: "np.ndarray", per_board: int, points: "np.ndarray"):
+    """
+    маска клеток рядов для каждой линии; очки рядов добавляются в points
+    """
+    count, width = lines.shape
+    mask = np.zeros((count, width), dtype=bool)
+    if width < 3:
+        return mask
+    same = lines[:, 1:] == lines[:, :-1]
+    padded = np.zeros((count, width + 1), dtype=np.int8)
+    padded[:, 1:-1] = same
+    edges = np.diff(padded, axis=1)
+    line_idx, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    lengths = ends - starts + 1
+    keep = lengths >= 3
+    line_idx, starts, ends = line_idx[keep], starts[keep], ends[keep]
+    if not line_idx.size:
+        return mask
+
+    table = np.array(_POINTS)
+    np.add.at(points, line_idx // per_board, table[np.minimum(lengths[keep], 6)])
+    # +1 at the start of a run, -1 after its end; the running sum is the mask
+    marks = np.zeros((count, width + 1), dtype=np.int8)
+    np.add.at(marks, (line_idx, starts), 1)
+    np.add.at(marks, (line_idx, ends + 1), -1)
+    mask[:] = np.cumsum(marks, axis=1)[:, :width] > 0
+    return mask
@@ -0,0 +1,238 @@
+"""
+Бенчмарки горячих участков: создание доски, поиск комбинаций, сдвиг,
+заполнение и полная обработка хода. Результаты сохраняются в JSON,
+чтобы сравнивать их между коммитами.
+"""
+
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Callable, NamedTuple
+
+from . import matcher
+from .elements import CombHandler, CompactBoard, ConcreteScore, PieceEnum
+from .game import ConcreteGameFactory
+from .moves import generate_moves
+from .rng import PieceRNG
+
+DEFAULT_SIZES = (8, 32, 128, 256)
+SEED = 12345
+
+# setup() готовит состояние и возвращает измеряемую операцию
+Setup = Callable[[], Callable[[], object]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    size: int
+    setup: Setup
+
+
+class BenchResult(NamedTuple):
+    name: str
+    size: int
+    runs: int
+    ops_per_sec: float
+    mean_us: float
+    min_us: float
+    alloc_blocks: int
+    peak_kib: float
+
+
+def _prepared(size: int, seed: int = SEED) -> tuple[CompactBoard, CombHandler]:
+    board = CompactBoard(size, rng=PieceRNG(seed))
+    handler = CombHandler(board, ConcreteScore(), headless=True)
+    handler.prepare_board()
+    return board, handler
+
+
+def _with_holes(size: int) -> tuple[CompactBoard, CombHandler]:
+    """
+    доска, на которой удалена каждая седьмая клетка
+    """
+    board, handler = _prepared(size)
+    empty = PieceEnum.X.value
+    for i in range(0, size * size, 7):
+        board.set_code(divmod(i, size), empty)
+    return board, handler
+
+
+def _create_game() -> Callable[[], object]:
+    return lambda: ConcreteGameFactory.create_new_game(True, SEED)
+
+
+def _prepare_board(size: int) -> Setup:
+    def setup():
+        board = CompactBoard(size, rng=PieceRNG(SEED))
+        return CombHandler(board, ConcreteScore(), headless=True).prepare_board
+
+    return setup
+
+
+def _find_combs(size: int, vectorized: bool) -> Setup:
+    def setup():
+        board, _ = _prepared(size)
+        handler = CombHandler(board, ConcreteScore(), vectorized, headless=True)
+        board.mark_all_dirty()
+        return handler._find_combs
+
+    return setup
+
+
+def _shift_elements(size: int) -> Setup:
+    def setup():
+        return _with_holes(size)[1]._shift_elements
+
+    return setup
+
+
+def _replace_elements(size: int) -> Setup:
+    def setup():
+        board, handler = _with_holes(size)
+        handler._shift_elements()
+        return handler._replace_elements
+
+    return setup
+
+
+def _resolve_move(size: int) -> Setup:
+    def setup():
+        board, handler = _prepared(size)
+        move = generate_moves(board)[0]
+
+        def resolve():
+            board.move(*move)
+            return handler.process_combs()
+
+        return resolve
+
+    return setup
+
+
+def default_scenarios(sizes: tuple[int, ...] = DEFAULT_SIZES) -> list[Scenario]:
+    scenarios = [Scenario("create_new_game", 8, _create_game)]
+    for size in sizes:
+        scenarios.append(Scenario("prepare_board", size, _prepare_board(size)))
+        scenarios.append(Scenario("find_combs", size, _find_combs(size, False)))
+        if matcher.HAS_NUMPY:
+            scenarios.append(
+                Scenario("find_combs[numpy]", size, _find_combs(size, True))
+            )
+        scenarios.append(Scenario("shift_elements", size, _shift_elements(size)))
+        scenarios.append(Scenario("replace_elements", size, _replace_elements(size)))
+        scenarios.append(Scenario("resolve_move", size, _resolve_move(size)))
+    return scenarios
+
+
+def run_scenario(
+    scenario: Scenario, min_time: float = 0.2, min_runs: int = 3
+) -> BenchResult:
+    """
+    операция повторяется на свежем состоянии, пока не наберётся
+    min_time секунд и min_runs запусков; подготовка не измеряется
+    """
+    times: list[float] = []
+    total = 0.0
+    while total < min_time or len(times) < min_runs:
+        op = scenario.setup()
+        start = time.perf_counter()
+        op()
+        elapsed = time.perf_counter() - start
+        times.append(elapsed)
+        total += elapsed
+
+    alloc_blocks, peak = _measure_memory(scenario.setup())
+    return BenchResult(
+        scenario.name,
+        scenario.size,
+        len(times),
+        len(times) / total,
+        total / len(times) * 1e6,
+        min(times) * 1e6,
+        alloc_blocks,
+        peak / 1024,
+    )
+
+
+def _measure_memory(op: Callable[[], object]) -> tuple[int, int]:
+    """
+    количество новых блоков памяти после операции и пик памяти во время неё
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = op()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        after = tracemalloc.take_snapshot()
+        del result
+    finally:
+        tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return blocks, peak
+
+
+def run_benchmarks(
+    scenarios: list[Scenario], min_time: float = 0.2, progress: bool = False
+) -> dict:
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario, min_time)
+        if progress:
+            print(format_result(result))
+        results.append(result._asdict())
+    return {"meta": _meta(), "results": results}
+
+
+def _meta() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": matcher.np.__version__ if matcher.HAS_NUMPY else None,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def format_result(result: BenchResult) -> str:
+    return (
+        f"{result.name:<20} {result.size:>4}x{result.size:<4}"
+        f" {result.ops_per_sec:>12.1f} ops/s {result.mean_us:>12.1f} us"
+        f" {result.alloc_blocks:>8} blocks {result.peak_kib:>10.1f} KiB peak"
+    )
+
+
+def save_results(report: dict, path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+
+
+def compare_results(baseline: dict, current: dict) -> list[str]:
+    """
+    строки сравнения: ускорение (>1) или замедление (<1) для каждого сценария
+    """
+    old = {(r["name"], r["size"]): r for r in baseline["results"]}
+    lines = []
+    for result in current["results"]:
+        before = old.get((result["name"], result["size"]))
+        if before is None:
+            continue
+        ratio = result["ops_per_sec"] / before["ops_per_sec"]
+        lines.append(
+            f"{result['name']:<20} {result['size']:>4}x{result['size']:<4}"
+            f" {ratio:>6.2f}x"
+        )
+    return lines
@@ -0,0 +1,113 @@
+"""
+Битовые маски доски: по одному int на код клетки (PieceEnum).
+
+Бит клетки (row, col) - row * (cols + 1) + col. Лишний бит в конце каждой
+строки всегда равен нулю, поэтому сдвиг на 1 не переносит ряд на соседнюю
+строку, а сдвиг на cols + 1 - переход на строку вниз. Поиск рядов и ходов
+сводится к сдвигам и AND целых масок, без обхода клеток.
+"""
+
+from functools import lru_cache
+from typing import Iterator
+
+Coords = tuple[int, int]
+
+# код клетки -> b"1" для клеток этого кода, иначе b"0" (таблицы bytes.translate)
+_DIGIT_TABLES = tuple(
+    bytes(ord("1") if value == code else ord("0") for value in range(256))
+    for code in range(256)
+)
+# b"0" / b"1" -> 0 / 1
+_FROM_DIGITS = bytes.maketrans(b"01", b"\x00\x01")
+# никогда не совпадает с кодом клетки: заполняет лишний бит строки
+_GUARD = b"\xff"
+
+
+def cell_bit(coord: Coords, cols: int) -> int:
+    row, col = coord
+    return 1 << (row * (cols + 1) + col)
+
+
+@lru_cache(maxsize=64)
+def full_mask(rows: int, cols: int) -> int:
+    """
+    маска всех клеток доски rows x cols
+    """
+    row = (1 << cols) - 1
+    mask = 0
+    for r in range(rows):
+        mask |= row << (r * (cols + 1))
+    return mask
+
+
+def masks_from_codes(codes: bytes, rows: int, cols: int, count: int) -> list[int]:
+    """
+    маски кодов 0 .. count - 1 по кодам клеток построчно
+    """
+    padded = b"".join(codes[r * cols : (r + 1) * cols] + _GUARD for r in range(rows))
+    # int() reads the most significant digit first, so reverse the bit order
+    digits = padded[::-1]
+    return [
+        int(digits.translate(_DIGIT_TABLES[code]) or b"0", 2) for code in range(count)
+    ]
+
+
+def to_cell_bytes(mask: int, rows: int, cols: int) -> bytes:
+    """
+    маска в виде байта на клетку построчно: 1 - бит клетки установлен
+    """
+    width = cols + 1
+    digits = format(mask, "b")[::-1].encode().ljust(rows * width, b"0")
+    cells = b"".join(digits[r * width : r * width + cols] for r in range(rows))
+    return cells.translate(_FROM_DIGITS)
+
+
+def iter_coords(mask: int, cols: int) -> Iterator[Coords]:
+    """
+    клетки маски по возрастанию индекса
+    """
+    width = cols + 1
+    while mask:
+        low = mask & -mask
+        yield divmod(low.bit_length() - 1, width)
+        mask ^= low
+
+
+def run_cells(mask: int, cols: int) -> int:
+    """
+    клетки маски, входящие в горизонтальные или вертикальные ряды от 3
+    """
+    width = cols + 1
+    # a bit survives if the next two cells of its line are set as well
+    starts = mask & (mask >> 1) & (mask >> 2)
+    cells = starts | (starts << 1) | (starts << 2)
+    starts = mask & (mask >> width) & (mask >> 2 * width)
+    cells |= starts | (starts << width) | (starts << 2 * width)
+    return cells
+
+
+def move_targets(mask: int, rows: int, cols: int) -> int:
+    """
+    клетки другого кода, в которые элемент из mask можно переместить
+    обменом с соседом так, чтобы получился ряд из 3
+    """
+    width = cols + 1
+    left, right = mask << 1, mask >> 1
+    up, down = mask << width, mask >> width
+
+    # target completes a row: two to the right, two to the left or one on
+    # each side; the piece comes from above/below or from the free side
+    before = right & (mask >> 2)
+    after = left & (mask << 2)
+    middle = left & right
+    targets = (before | after | middle) & (up | down)
+    targets |= before & left | after & right
+
+    # the same along the column, with the piece coming from the sides
+    before = down & (mask >> 2 * width)
+    after = up & (mask << 2 * width)
+    middle = up & down
+    targets |= (before | after | middle) & (left | right)
+    targets |= before & up | after & down
+
+    return targets & full_mask(rows, cols) & ~mask
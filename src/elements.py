@@ -1,10 +1,16 @@
 import os
 import random
+import re
+import sys
 from abc import ABC, abstractmethod
 from enum import Enum
+from functools import lru_cache
 from shutil import get_terminal_size
 from time import sleep
-from typing import Protocol, Self
+from typing import Generator, Iterable, NamedTuple, Protocol, Self, Sequence
+
+from . import bitboard, matcher
+from .rng import PieceRNG
 
 Coords = tuple[int, int]
 Move = tuple[Coords]
@@ -47,6 +53,9 @@ class PieceEnum(Enum):
     E = 5
 
 
+PIECES = tuple(PieceEnum)
+
+
 class Piece(ABC):
     """
     класс анализа
@@ -89,12 +98,21 @@ class ConcretePiece(Piece):
         5: "\033[91m",
     }
 
-    def __init__(self) -> None:
+    # общий генератор для элементов вне доски
+    _default_rng = PieceRNG()
+
+    def __init__(
+        self, rng: PieceRNG | None = None, value: PieceEnum | None = None
+    ) -> None:
         super().__init__()
-        self.set_random_value()
+        self._rng = rng if rng is not None else self._default_rng
+        if value is None:
+            self.set_random_value()
+        else:
+            self.set_value(value)
 
     def set_random_value(self) -> None:
-        self._value = random.choice(list(PieceEnum)[1:])
+        self._value = PIECES[self._rng.next_code()]
 
     def set_empty_value(self) -> None:
         self._value = PieceEnum.X
@@ -103,7 +121,30 @@ class ConcretePiece(Piece):
         self._value = val
 
     def __str__(self) -> str:
-        return str(self.colors[self._value.value] + self._value.name + "\033[0m")
+        return GLYPH_TABLES[GlyphMode.COLOR][self._value.value]
+
+
+RESET = "\033[0m"
+
+
+class GlyphMode(Enum):
+    COLOR = 0
+    # буквы без ANSI-цветов (вывод в файл, терминал без цвета)
+    PLAIN = 1
+    # без цветов и сетки: строка доски - номер и буквы подряд, пустая клетка - "."
+    COMPACT = 2
+
+
+def _make_glyphs(mode: GlyphMode) -> tuple[str, ...]:
+    if mode is GlyphMode.COLOR:
+        return tuple(ConcretePiece.colors[p.value] + p.name + RESET for p in PIECES)
+    if mode is GlyphMode.COMPACT:
+        return tuple("." if p is PieceEnum.X else p.name for p in PIECES)
+    return tuple(p.name for p in PIECES)
+
+
+# отрисованный элемент для каждого кода клетки (видимая ширина - 1 символ)
+GLYPH_TABLES = {mode: _make_glyphs(mode) for mode in GlyphMode}
 
 
 class Points:
@@ -143,12 +184,14 @@ class AbsCombination(ABC):
         pass
 
     @abstractmethod
-    def get_coords(self) -> set[Coords]:
+    def get_coords(self) -> frozenset[Coords]:
         pass
 
-    # @abstractmethod
-    # def get_bonus(self) -> Bonus:
-    #     pass
+    @abstractmethod
+    def get_bonus(self) -> "Bonus | None":
+        """
+        бонус за комбинацию (None - комбинация слишком короткая)
+        """
 
 
 class Combination(AbsCombination):
@@ -157,14 +200,19 @@ class Combination(AbsCombination):
     получение значений счёта и бонусов из уничтоженных элементов
     """
 
-    def __init__(self, coords: set[Coords]) -> None:
+    def __init__(self, coords: Iterable[Coords]) -> None:
         super().__init__()
-        self._coords = coords
+        self._coords = frozenset(coords)
 
     def __hash__(self) -> int:
         return hash(self._coords)
 
-    def get_coords(self) -> set[Coords]:
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Combination):
+            return NotImplemented
+        return self._coords == other._coords
+
+    def get_coords(self) -> frozenset[Coords]:
         return self._coords
 
     # queries
@@ -178,9 +226,41 @@ class Combination(AbsCombination):
             return Points(9)
         return Points(15)
 
-    # def get_bonus(self) -> Bonus:
-    #     # TODO:
-    #     pass
+    def get_bonus(self) -> "Bonus | None":
+        length = len(self._coords)
+        if length < 4:
+            return None
+        if length == 4:
+            rows = {row for row, _ in self._coords}
+            return RowBonus() if len(rows) == 1 else ColumnBonus()
+        if length == 5:
+            return BombBonus()
+        return ColorBonus()
+
+
+class Match(NamedTuple):
+    """
+    класс реализации
+    комбинация шага каскада: длина, код элементов и очки за неё
+    """
+
+    length: int
+    code: int
+    points: int
+
+
+class CascadeStep(NamedTuple):
+    """
+    класс реализации
+    результат одного шага каскада
+    """
+
+    removed: set[Coords]
+    shifted_cols: list[int]
+    refilled: list[Coords]
+    points: Points
+    # комбинации шага (пусто для шага бонусов)
+    matches: tuple[Match, ...] = ()
 
 
 class Score(Printable):
@@ -206,6 +286,17 @@ class Score(Printable):
         post: self._points -= points
         """
 
+    @abstractmethod
+    def set_points(self, points: Points) -> None:
+        """
+        post: self._points = points
+        """
+
+    # query
+    @abstractmethod
+    def get_points(self) -> Points:
+        pass
+
 
 class ConcreteScore(Score):
 
@@ -222,6 +313,31 @@ class ConcreteScore(Score):
     def remove_points(self, points: int) -> None:
         self._score -= Points(points)
 
+    def set_points(self, points: Points) -> None:
+        self._score = points
+
+    def get_points(self) -> Points:
+        return self._score
+
+
+# значения кода клетки умещаются в 3 бита (PieceEnum.X..E)
+ZOBRIST_CODES = 8
+
+
+# ненулевой байт (отличающаяся клетка в xor двух состояний доски)
+_NON_ZERO = re.compile(rb"[^\x00]")
+
+
+@lru_cache(maxsize=None)
+def zobrist_keys(cells: int) -> tuple[int, ...]:
+    """
+    64-битный ключ для каждой пары (клетка, код): keys[index * 8 + code]
+    ключи фиксированы для размера доски, поэтому хэш одной и той же
+    позиции одинаков во всех процессах
+    """
+    rng = random.Random(f"zobrist-{cells}")
+    return tuple(rng.getrandbits(64) for _ in range(cells * ZOBRIST_CODES))
+
 
 class Board(Printable):
     """
@@ -231,6 +347,23 @@ class Board(Printable):
 
     _matrix: list[list[Piece]]
     _move_status = -1
+    _rng: PieceRNG
+    # строки и столбцы, изменившиеся с последнего поиска комбинаций
+    _dirty_rows: set[int]
+    _dirty_cols: set[int]
+    # хэш Zobrist текущей позиции, обновляется при каждом изменении клетки
+    _hash: int
+    _zobrist: tuple[int, ...]
+    # битовая маска клеток каждого кода (см. bitboard), обновляется вместе
+    # с хэшем; None - маски устарели и будут пересчитаны при запросе
+    _bits: list[int] | None
+    _lazy_bits: bool
+    # как выводятся клетки в render() и кадрах TerminalRenderer
+    _glyph_mode: GlyphMode = GlyphMode.COLOR
+
+    # с какого размера доски маски пересчитываются при запросе, а не при
+    # каждом изменении клетки (XOR длинных int дороже одного пересчёта)
+    LAZY_BITS_MIN_CELLS = 1024
 
     @abstractmethod
     def move(self, coord1: Coords, coord2: Coords) -> None:
@@ -263,43 +396,274 @@ class Board(Printable):
     def render(self) -> None:
         pass
 
+    @abstractmethod
+    def set_code(self, coord: Coords, code: int) -> None:
+        """
+        post: в клетке coord элемент со значением PieceEnum(code)
+        post: строка и столбец клетки помечены изменёнными
+        """
+
+    def mark_dirty(self, coord: Coords) -> None:
+        """
+        post: строка и столбец клетки помечены изменёнными
+        """
+        row, col = coord
+        self._dirty_rows.add(row)
+        self._dirty_cols.add(col)
+
+    def _rehash(self) -> None:
+        """
+        post: хэш и битовые маски пересчитаны по всем клеткам доски
+        """
+        rows, cols = self.get_rows(), self.get_cols()
+        self._zobrist = zobrist_keys(rows * cols)
+        keys = self._zobrist
+        value = 0
+        for index, code in enumerate(self.get_codes()):
+            value ^= keys[index * ZOBRIST_CODES + code]
+        self._hash = value
+        self._lazy_bits = rows * cols >= self.LAZY_BITS_MIN_CELLS
+        self._bits = None
+        if not self._lazy_bits:
+            self._get_bits()
+
+    def _swap_hash(self, i: int, j: int, code_i: int, code_j: int) -> int:
+        """
+        изменение хэша при обмене кодов клеток i и j
+        """
+        keys, n = self._zobrist, ZOBRIST_CODES
+        return (
+            keys[i * n + code_i]
+            ^ keys[i * n + code_j]
+            ^ keys[j * n + code_j]
+            ^ keys[j * n + code_i]
+        )
+
+    def mark_all_dirty(self) -> None:
+        """
+        post: все строки и столбцы помечены изменёнными
+        """
+        self._dirty_rows = set(range(self.get_rows()))
+        self._dirty_cols = set(range(self.get_cols()))
+
+    def load_codes(self, codes: bytes) -> None:
+        """
+        pre : codes получены из dump_codes доски того же размера
+        post: клетки доски совпадают с codes
+        post: переписаны только отличающиеся клетки
+        """
+        current = self.dump_codes()
+        diff = int.from_bytes(current, "little") ^ int.from_bytes(codes, "little")
+        cols = self.get_cols()
+        # the regex scans the xor in C: one Python step per changed cell
+        for match in _NON_ZERO.finditer(diff.to_bytes(len(codes), "little")):
+            index = match.start()
+            self.set_code(divmod(index, cols), codes[index])
+
+    def pop_dirty_lines(self) -> tuple[set[int], set[int]]:
+        """
+        post: возвращены изменённые строки и столбцы, отметки сброшены
+        """
+        lines = self._dirty_rows, self._dirty_cols
+        self._dirty_rows = set()
+        self._dirty_cols = set()
+        return lines
+
+    def set_rng(self, rng: PieceRNG) -> None:
+        """
+        post: новые элементы доски берутся из rng
+        """
+        self._rng = rng
+
     # query
     @abstractmethod
     def get_board_piece(self, coord: Coords) -> Piece:
         row, col = coord
         return self._matrix[row][col]
 
+    @abstractmethod
+    def get_code(self, coord: Coords) -> int:
+        """
+        значение PieceEnum клетки coord
+        """
+
+    @abstractmethod
+    def get_codes(self) -> Sequence[int]:
+        """
+        значения PieceEnum всех клеток построчно (row * cols + col)
+        """
+
     def get_move_status(self) -> int:
         return self._move_status
 
     def get_size(self) -> int:
+        """
+        количество строк (для квадратной доски - её размер)
+        """
+        return self.get_rows()
+
+    def get_rows(self) -> int:
         return len(self._matrix)
 
+    def get_cols(self) -> int:
+        return len(self._matrix[0])
 
-class ConcreteBoard8X8(Board):
-    def __init__(self) -> None:
+    def get_rng(self) -> PieceRNG:
+        return self._rng
+
+    def get_hash(self) -> int:
+        """
+        хэш Zobrist позиции (одинаковые позиции - одинаковый хэш)
+        """
+        return self._hash
+
+    def get_color_mask(self, code: int) -> int:
+        """
+        битовая маска клеток со значением code (раскладка - см. bitboard)
+        """
+        return self._get_bits()[code]
+
+    def has_eager_bits(self) -> bool:
+        """
+        маски кодов обновляются при каждом изменении клетки (маленькая
+        доска); иначе get_color_mask пересчитывает их по всей доске
+        """
+        return not self._lazy_bits
+
+    def count_code(self, code: int) -> int:
+        return self._get_bits()[code].bit_count()
+
+    def _get_bits(self) -> list[int]:
+        if self._bits is None:
+            self._bits = bitboard.masks_from_codes(
+                self.dump_codes(), self.get_rows(), self.get_cols(), ZOBRIST_CODES
+            )
+        return self._bits
+
+    def get_match_mask(self) -> int:
+        """
+        битовая маска клеток, входящих в ряды из 3 и более одинаковых элементов
+        """
+        cols = self.get_cols()
+        cells = 0
+        for mask in self._get_bits():
+            if mask:
+                cells |= bitboard.run_cells(mask, cols)
+        return cells
+
+    def dump_codes(self) -> bytes:
+        """
+        упакованное состояние доски: один байт на клетку
+        """
+        return bytes(self.get_codes())
+
+    def get_glyphs(self) -> tuple[str, ...]:
+        """
+        отрисованный элемент для каждого кода клетки в текущем режиме
+        """
+        return GLYPH_TABLES[self._glyph_mode]
+
+    def get_glyph_mode(self) -> GlyphMode:
+        return self._glyph_mode
+
+    def set_glyph_mode(self, mode: GlyphMode) -> None:
+        """
+        post: render() и кадры выводят клетки в режиме mode
+        """
+        self._glyph_mode = mode
+
+    def get_cell_position(self, coord: Coords) -> tuple[int, int]:
+        """
+        строка и столбец экрана (с 1) элемента coord в выводе render()
+        """
+        row_width, col_width = len(str(self.get_rows())), len(str(self.get_cols()))
+        row, col = coord
+        if self._glyph_mode is GlyphMode.COMPACT:
+            # "    <row> | " before the first cell, one character per cell
+            return 4 + row, 8 + row_width + col
+        # "    | <row> || " before the first cell, "<pad><cell> | " per cell
+        prefix = 10 + row_width
+        return 5 + 2 * row, prefix + col * (col_width + 3) + col_width
+
+    def get_frame_height(self) -> int:
+        """
+        количество строк экрана, занимаемых выводом render()
+        """
+        if self._glyph_mode is GlyphMode.COMPACT:
+            return 4 + self.get_rows()
+        return 5 + 2 * self.get_rows()
+
+    def format_frame(self, codes: bytes | None = None) -> str:
+        """
+        вывод render() одной строкой: сетка с номерами строк и столбцов
+        codes - состояние доски из dump_codes (None - текущее)
+        """
+        if codes is None:
+            codes = self.dump_codes()
+        rows, cols = self.get_rows(), self.get_cols()
+        row_width, col_width = len(str(rows)), len(str(cols))
+        mode = self._glyph_mode
+        if mode is GlyphMode.COMPACT:
+            ruler = "".join(str((i + 1) % 10) for i in range(cols))
+            parts = ["\n\n", " " * (row_width + 7) + ruler + "\n"]
+            for i in range(rows):
+                cells = _format_cells(codes[i * cols : (i + 1) * cols], mode, 1)
+                parts.append(f"    {i + 1:>{row_width}} | {cells}\n")
+            parts.append("\n")
+            return "".join(parts)
+        line = row_width + cols * (col_width + 3) + 5
+        parts = ["\n\n", "     game" + " " * row_width]
+        for i in range(cols):
+            parts.append(f" {i + 1:>{col_width}} |")
+        parts.append("\n    " + "=" * line + "\n")
+        separator = " |\n    " + "-" * line + "\n"
+        for i in range(rows):
+            parts.append(f"    | {i + 1:>{row_width}} || ")
+            parts.append(
+                _format_cells(codes[i * cols : (i + 1) * cols], mode, col_width)
+            )
+            parts.append(separator)
+        parts.append("\n")
+        return "".join(parts)
+
+
+@lru_cache(maxsize=4096)
+def _format_cells(codes: bytes, mode: GlyphMode, col_width: int) -> str:
+    """
+    клетки одной строки доски; кэш по содержимому строки, поэтому
+    строка собирается заново только после изменения её клеток
+    """
+    glyphs = GLYPH_TABLES[mode]
+    if mode is GlyphMode.COMPACT:
+        return "".join([glyphs[code] for code in codes])
+    pad = " " * (col_width - 1)
+    return " | ".join([pad + glyphs[code] for code in codes])
+
+
+class ConcreteBoard(Board):
+    """
+    класс реализации
+    доска rows x cols из отдельных элементов ConcretePiece
+    """
+
+    def __init__(self, rows: int, cols: int, rng: PieceRNG | None = None) -> None:
         super().__init__()
-        self._matrix = [[ConcretePiece() for _ in range(8)] for _ in range(8)]
+        self._rng = rng if rng is not None else PieceRNG()
+        codes = self._rng.draw(rows * cols)
+        self._matrix = [
+            [ConcretePiece(self._rng, PIECES[codes[r * cols + c]]) for c in range(cols)]
+            for r in range(rows)
+        ]
+        self._cols = cols
+        self._rehash()
+        self.mark_all_dirty()
 
     def render(self) -> None:
-        size = len(self._matrix)
-        print("\n")
-        print("     game ", end="")
-        for i in range(size):
-            print(f" {i + 1} |", end="")
-        print("\n    ", end="")
-        print("=" * (size * 4 + 6))
-        for i, row in enumerate(self._matrix):
-            print(f"    | {i + 1} || ", end="")
-            print(" | ".join(str(cell) for cell in row), end="")
-            print(" |")
-            print("    ", end="")
-            print("-" * (len(row) * 4 + 6))
-        print("")
+        sys.stdout.write(self.format_frame())
 
     def move(self, coord1: Coords, coord2: Coords) -> None:
         self._swap(coord1, coord2)
-        self._validate_move(coord1, coord2)
+        self._move_status = int(self._validate_move(coord1, coord2))
 
         if not self.get_move_status():
             self._swap(coord2, coord1)
@@ -308,9 +672,24 @@ class ConcreteBoard8X8(Board):
     def _swap(self, coord1: Coords, coord2: Coords) -> None:
         row1, col1 = coord1
         row2, col2 = coord2
-        tmp = self._matrix[row1][col1]
-        self._matrix[row1][col1] = self._matrix[row2][col2]
-        self._matrix[row2][col2] = tmp
+        piece1 = self._matrix[row1][col1]
+        piece2 = self._matrix[row2][col2]
+        self._matrix[row1][col1] = piece2
+        self._matrix[row2][col2] = piece1
+        code1, code2 = piece1._value.value, piece2._value.value
+        self._hash ^= self._swap_hash(
+            row1 * self._cols + col1, row2 * self._cols + col2, code1, code2
+        )
+        if self._lazy_bits:
+            self._bits = None
+        elif code1 != code2:
+            flip = (1 << (row1 * (self._cols + 1) + col1)) | (
+                1 << (row2 * (self._cols + 1) + col2)
+            )
+            self._bits[code1] ^= flip
+            self._bits[code2] ^= flip
+        self.mark_dirty(coord1)
+        self.mark_dirty(coord2)
 
     def _validate_move(self, coord1: Coords, coord2: Coords) -> bool:
         row1, col1 = coord1
@@ -332,8 +711,163 @@ class ConcreteBoard8X8(Board):
         return self._move_status
 
     def get_board_piece(self, coord: Coords) -> Piece:
+        # changes go through set_code, keeping the hash and masks in sync
+        return PieceView(self, coord)
+
+    def set_code(self, coord: Coords, code: int) -> None:
         row, col = coord
-        return self._matrix[row][col]
+        piece = self._matrix[row][col]
+        old = piece._value.value
+        index = (row * self._cols + col) * ZOBRIST_CODES
+        self._hash ^= self._zobrist[index + old] ^ self._zobrist[index + code]
+        if self._lazy_bits:
+            self._bits = None
+        else:
+            bit = 1 << (row * (self._cols + 1) + col)
+            self._bits[old] ^= bit
+            self._bits[code] ^= bit
+        piece.set_value(PIECES[code])
+        self.mark_dirty(coord)
+
+    def get_code(self, coord: Coords) -> int:
+        row, col = coord
+        return self._matrix[row][col]._value.value
+
+    def get_codes(self) -> list[int]:
+        return [piece._value.value for row in self._matrix for piece in row]
+
+
+class ConcreteBoard8X8(ConcreteBoard):
+    def __init__(self, rng: PieceRNG | None = None) -> None:
+        super().__init__(8, 8, rng)
+
+
+class PieceView(ConcretePiece):
+    """
+    класс реализации
+    элемент доски (ссылка на клетку, а не отдельный объект):
+    изменения проходят через set_code доски
+    """
+
+    def __init__(self, board: Board, coord: Coords) -> None:
+        self._board = board
+        self._coord = coord
+
+    @property
+    def _value(self) -> PieceEnum:
+        return PIECES[self._board.get_code(self._coord)]
+
+    def set_random_value(self) -> None:
+        self._board.set_code(self._coord, self._board.get_rng().next_code())
+
+    def set_empty_value(self) -> None:
+        self._board.set_code(self._coord, PieceEnum.X.value)
+
+    def set_value(self, val: PieceEnum) -> None:
+        self._board.set_code(self._coord, val.value)
+
+
+class CompactBoard(Board):
+    """
+    класс реализации
+    игровая доска rows x cols, хранящая значения клеток в одном bytearray
+    """
+
+    def __init__(
+        self, rows: int = 8, cols: int | None = None, rng: PieceRNG | None = None
+    ) -> None:
+        super().__init__()
+        self._rows = rows
+        self._cols = cols if cols is not None else rows
+        self._rng = rng if rng is not None else PieceRNG()
+        self._cells = bytearray(self._rng.draw(self._rows * self._cols))
+        self._rehash()
+        self.mark_all_dirty()
+
+    @property
+    def _matrix(self) -> list[list[Piece]]:
+        return [
+            [self.get_board_piece((row, col)) for col in range(self._cols)]
+            for row in range(self._rows)
+        ]
+
+    def render(self) -> None:
+        sys.stdout.write(self.format_frame())
+
+    def move(self, coord1: Coords, coord2: Coords) -> None:
+        self._swap(coord1, coord2)
+        self._move_status = int(self._validate_move(coord1, coord2))
+
+        if not self.get_move_status():
+            self._swap(coord2, coord1)
+            return
+
+    def _swap(self, coord1: Coords, coord2: Coords) -> None:
+        i = coord1[0] * self._cols + coord1[1]
+        j = coord2[0] * self._cols + coord2[1]
+        cells = self._cells
+        code_i, code_j = cells[i], cells[j]
+        self._hash ^= self._swap_hash(i, j, code_i, code_j)
+        if self._lazy_bits:
+            self._bits = None
+        elif code_i != code_j:
+            width = self._cols + 1
+            flip = (1 << (coord1[0] * width + coord1[1])) | (
+                1 << (coord2[0] * width + coord2[1])
+            )
+            self._bits[code_i] ^= flip
+            self._bits[code_j] ^= flip
+        cells[i], cells[j] = code_j, code_i
+        self.mark_dirty(coord1)
+        self.mark_dirty(coord2)
+
+    def _validate_move(self, coord1: Coords, coord2: Coords) -> bool:
+        row1, col1 = coord1
+        row2, col2 = coord2
+        if not abs(row1 - row2) + abs(col1 - col2) == 1:
+            return False
+        return True
+
+    def _delete_elements(self) -> None:
+        pass
+
+    def _shift_elements(self) -> None:
+        pass
+
+    def _add_new_elements(self) -> None:
+        pass
+
+    def set_code(self, coord: Coords, code: int) -> None:
+        row, col = coord
+        i = row * self._cols + col
+        old = self._cells[i]
+        index = i * ZOBRIST_CODES
+        self._hash ^= self._zobrist[index + old] ^ self._zobrist[index + code]
+        if self._lazy_bits:
+            self._bits = None
+        else:
+            bit = 1 << (row * (self._cols + 1) + col)
+            self._bits[old] ^= bit
+            self._bits[code] ^= bit
+        self._cells[i] = code
+        self.mark_dirty(coord)
+
+    # query
+    def get_board_piece(self, coord: Coords) -> Piece:
+        return PieceView(self, coord)
+
+    def get_code(self, coord: Coords) -> int:
+        row, col = coord
+        return self._cells[row * self._cols + col]
+
+    def get_codes(self) -> bytearray:
+        return self._cells
+
+    def get_rows(self) -> int:
+        return self._rows
+
+    def get_cols(self) -> int:
+        return self._cols
 
 
 class Bonus(ABC):
@@ -342,9 +876,28 @@ class Bonus(ABC):
     бонус, влияющий на игру. применяемый игроком
     """
 
+    _name = "Bonus"
+
+    # command
     @abstractmethod
-    def apply_bonus(self, board: Board) -> None:
-        pass
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        """
+        pre : coord на доске, в mask по байту на клетку построчно
+        post: клетки, которые очищает бонус, применённый к coord,
+              отмечены в mask единицами (остальные отметки сохранены)
+        """
+
+    def apply_bonus(self, board: Board, coord: Coords) -> set[Coords]:
+        """
+        post: клетки бонуса пусты (без сдвига и заполнения)
+        возвращает очищенные клетки
+        """
+        mask = bytearray(board.get_rows() * board.get_cols())
+        self.mark_cells(board, coord, mask)
+        return clear_cells(board, mask)
+
+    def __str__(self) -> str:
+        return self._name
 
 
 class RemoveBonus(Bonus):
@@ -353,11 +906,105 @@ class RemoveBonus(Bonus):
         super().__init__()
         self._name = "Remove Bonus"
 
-    def apply_bonus(self, board: Board) -> None:
-        pass
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        row, col = coord
+        mask[row * board.get_cols() + col] = 1
+
+
+class RowBonus(Bonus):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._name = "Row Clear"
+
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        cols = board.get_cols()
+        start = coord[0] * cols
+        mask[start : start + cols] = b"\x01" * cols
+
+
+class ColumnBonus(Bonus):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._name = "Column Clear"
+
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        mask[coord[1] :: board.get_cols()] = b"\x01" * board.get_rows()
 
-    def __str__(self) -> str:
-        return self._name
+
+class BombBonus(Bonus):
+
+    # клетки на расстоянии до RADIUS по строке и столбцу
+    RADIUS = 1
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._name = "Bomb"
+
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        rows, cols = board.get_rows(), board.get_cols()
+        row, col = coord
+        left, right = max(col - self.RADIUS, 0), min(col + self.RADIUS + 1, cols)
+        top, bottom = max(row - self.RADIUS, 0), min(row + self.RADIUS + 1, rows)
+        for r in range(top, bottom):
+            mask[r * cols + left : r * cols + right] = b"\x01" * (right - left)
+
+
+class ColorBonus(Bonus):
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._name = "Color Clear"
+
+    def mark_cells(self, board: Board, coord: Coords, mask: bytearray) -> None:
+        """
+        post: отмечены все клетки цвета клетки coord
+        """
+        rows, cols = board.get_rows(), board.get_cols()
+        color_mask = board.get_color_mask(board.get_code(coord))
+        hits = bitboard.to_cell_bytes(color_mask, rows, cols)
+        # OR the whole mask at once instead of walking the cells
+        merged = int.from_bytes(mask, "little") | int.from_bytes(hits, "little")
+        mask[:] = merged.to_bytes(len(mask), "little")
+
+
+def clear_cells(board: Board, mask: bytearray) -> set[Coords]:
+    """
+    post: клетки, отмеченные в mask, пусты
+    возвращает очищенные клетки
+    """
+    cols = board.get_cols()
+    empty = PieceEnum.X.value
+    cleared: set[Coords] = set()
+    index = mask.find(1)
+    while index != -1:
+        coord = divmod(index, cols)
+        board.set_code(coord, empty)
+        cleared.add(coord)
+        index = mask.find(1, index + 1)
+    return cleared
+
+
+class FrameRenderer(ABC):
+    """
+    класс проектирования
+    вывод кадров доски на экран
+    """
+
+    # command
+    @abstractmethod
+    def draw(self, board: Board, footer: str | None = None) -> None:
+        """
+        post: на экране текущее состояние board
+        post: под доской выведен footer (None - оставить прежний)
+        """
+
+    @abstractmethod
+    def invalidate(self) -> None:
+        """
+        post: следующий кадр будет выведен полностью
+        """
 
 
 class AbsCombHandler(ABC):
@@ -373,10 +1020,11 @@ class AbsCombHandler(ABC):
 
     # command
     @abstractmethod
-    def process_combs(self) -> None:
+    def process_combs(self) -> list[CascadeStep]:
         """
         post: matched pieces are empty
         post: score increased
+        возвращает шаги каскада
         """
 
     # query
@@ -387,28 +1035,117 @@ class AbsCombHandler(ABC):
 
 class CombHandler(AbsCombHandler):
 
+    # с какого размера доски NumPy быстрее построчного поиска
+    VECTORIZE_MIN_CELLS = 256
+
+    def __init__(
+        self,
+        board: Board,
+        score: Score,
+        vectorized: bool | None = None,
+        headless: bool = False,
+        renderer: FrameRenderer | None = None,
+        bonus_list: "BonusList | None" = None,
+    ) -> None:
+        super().__init__(board, score)
+        if vectorized is None:
+            cells = board.get_rows() * board.get_cols()
+            vectorized = cells >= self.VECTORIZE_MIN_CELLS
+        self._vectorized = vectorized and matcher.HAS_NUMPY
+        # headless: без пауз, очистки экрана и отрисовки
+        self._headless = headless
+        # None - кадр выводится очисткой экрана и полной перерисовкой
+        self._renderer = renderer
+        # самая нижняя удалённая клетка каждого столбца (после удаления)
+        self._lowest_holes: dict[int, int] | None = None
+        # (столбец, количество пустых клеток сверху) после сдвига
+        self._empty_tops: list[tuple[int, int]] | None = None
+        # куда добавляются бонусы за длинные комбинации (None - не выдавать)
+        self._bonus_list = bonus_list
+
     # command
-    def process_combs(self) -> None:
-        self._find_combs()
+    def process_combs(self) -> list[CascadeStep]:
+        return self.play(self.iter_cascade())
+
+    def play(
+        self, frames: Generator[bool, None, list[CascadeStep]]
+    ) -> list[CascadeStep]:
+        """
+        кадры iter_cascade или iter_bonus_cascade с паузами и отрисовкой
+        """
         while True:
+            try:
+                redraw = next(frames)
+            except StopIteration as stop:
+                return stop.value
+            if redraw:
+                self._show_frame()
+            else:
+                self._pause()
+
+    def iter_cascade(self) -> Generator[bool, None, list[CascadeStep]]:
+        """
+        обработка комбинаций по кадрам, без пауз и отрисовки:
+        False - пауза перед первым шагом, True - доска изменилась
+        возвращает шаги каскада (как process_combs)
+        """
+        steps: list[CascadeStep] = []
+        self._find_combs()
+        if self.has_matches():
+            yield False
+        while self.has_matches():
+            matches = self._describe_matches()
+            removed = self._remove_elements()
+            yield True
+            shifted_cols = self._shift_elements()
+            yield True
+            refilled = self._replace_elements()
+            yield True
+            points = self._update_score()
+            steps.append(CascadeStep(removed, shifted_cols, refilled, points, matches))
+            self._award_bonuses()
+            self._clear_combs()
+            self._find_combs()
+        return steps
+
+    def iter_bonus_cascade(
+        self, activations: Sequence[tuple[Bonus, Coords]]
+    ) -> Generator[bool, None, list[CascadeStep]]:
+        """
+        применение бонусов и последующий каскад по кадрам (см. iter_cascade)
+        области всех бонусов собираются в одну маску по доске до очистки,
+        затем очищаются, сдвигаются и заполняются за один проход
+        """
+        rows, cols = self._board.get_rows(), self._board.get_cols()
+        mask = bytearray(rows * cols)
+        for bonus, coord in activations:
+            bonus.mark_cells(self._board, coord, mask)
+        removed = self._remove_mask(mask)
+        yield True
+        shifted_cols = self._shift_elements()
+        yield True
+        refilled = self._replace_elements()
+        yield True
+        # one point for every cleared cell
+        points = Points(len(removed))
+        self._score.add_points(points)
+        steps = [CascadeStep(removed, shifted_cols, refilled, points)]
+        steps += yield from self.iter_cascade()
+        return steps
+
+    def _pause(self) -> None:
+        if not self._headless:
             sleep(1)
-            self._remove_elements()
-            self._board.clear_screen()
-            self._board.render()
-            sleep(1)
-            self._shift_elements()
-            self._board.clear_screen()
-            self._board.render()
-            sleep(1)
-            self._replace_elements()
+
+    def _show_frame(self) -> None:
+        if self._headless:
+            return
+        if self._renderer is not None:
+            self._renderer.draw(self._board)
+        else:
             self._board.clear_screen()
             self._board.render()
-            sleep(1)
-            self._update_score()
-            self._clear_combs()
-            self._find_combs()
-            if not self.has_matches():
-                break
+        sleep(1)
 
     def prepare_board(self) -> None:
         while True:
@@ -419,100 +1156,224 @@ class CombHandler(AbsCombHandler):
             self._clear_combs()
 
     def _prepare_board_elements(self) -> None:
-        matrix = self._get_matrix()
+        cells: set[Coords] = set()
         for comb in self._combs:
-            for coord in comb.get_coords():
-                row, col = coord
-                matrix[row][col].set_random_value()
-
-    def _update_score(self) -> None:
+            cells |= comb.get_coords()
+        coords = sorted(cells)
+        codes = self._board.get_rng().draw(len(coords))
+        for coord, code in zip(coords, codes):
+            self._board.set_code(coord, code)
+
+    def _update_score(self) -> Points:
+        points = Points(0)
         for comb in self._combs:
-            self._score.add_points(comb.get_score_points())
+            points += comb.get_score_points()
+        self._score.add_points(points)
+        return points
 
-    def _remove_elements(self) -> None:
-        matrix = self._get_matrix()
+    def _remove_elements(self) -> set[Coords]:
+        empty = PieceEnum.X.value
+        removed: set[Coords] = set()
         for comb in self._combs:
-            for coord in comb.get_coords():
-                row, col = coord
-                matrix[row][col].set_empty_value()
+            removed |= comb.get_coords()
+        lowest = self._lowest_holes = {}
+        for coord in removed:
+            self._board.set_code(coord, empty)
+            row, col = coord
+            if lowest.get(col, -1) < row:
+                lowest[col] = row
+        return removed
+
+    def _remove_mask(self, mask: bytearray) -> set[Coords]:
+        removed = clear_cells(self._board, mask)
+        lowest = self._lowest_holes = {}
+        for row, col in removed:
+            if lowest.get(col, -1) < row:
+                lowest[col] = row
+        return removed
+
+    def _describe_matches(self) -> tuple[Match, ...]:
+        """
+        комбинации до удаления, пока на их месте ещё стоят элементы
+        """
+        get_code = self._board.get_code
+        matches = []
+        for comb in self._combs:
+            coords = comb.get_coords()
+            code = get_code(next(iter(coords)))
+            matches.append(Match(len(coords), code, comb.get_score_points().value))
+        return tuple(matches)
 
-    def _shift_elements(self) -> None:
-        matrix = self._get_matrix()
-        rows = len(matrix)
-        cols = len(matrix[0])
+    def _award_bonuses(self) -> None:
+        if self._bonus_list is None:
+            return
+        for comb in self._combs:
+            bonus = comb.get_bonus()
+            if bonus is not None:
+                self._bonus_list.add_bouns(bonus)
 
-        for c in range(cols):
-            column = [matrix[r][c] for r in range(rows)]
-            column.sort(key=lambda x: 0 if x._value.value > 0 else 1, reverse=True)
+    def _shift_elements(self) -> list[int]:
+        """
+        post: в каждом столбце элементы сдвинуты вниз на место пустых
+        post: запомнено, сколько пустых клеток осталось сверху каждого столбца
+        """
+        rows, cols = self._board.get_rows(), self._board.get_cols()
+        codes = self._board.get_codes()
+        empty = PieceEnum.X.value
+        set_code = self._board.set_code
+
+        # after _remove_elements only columns with holes need a pass,
+        # starting from their lowest hole; otherwise check every column
+        if self._lowest_holes is not None:
+            columns = sorted(self._lowest_holes.items())
+        else:
+            columns = [(c, rows - 1) for c in range(cols)]
+        self._lowest_holes = None
+
+        shifted_cols: list[int] = []
+        empty_tops: list[tuple[int, int]] = []
+        for c, bottom in columns:
+            # two pointers walking up: every piece is read once and written
+            # straight to its final row, so no temporary column is built
+            write = bottom
+            for read in range(bottom, -1, -1):
+                code = codes[read * cols + c]
+                if code != empty:
+                    if write != read:
+                        set_code((write, c), code)
+                    write -= 1
+            if write < 0:
+                continue
+            for r in range(write + 1):
+                if codes[r * cols + c] != empty:
+                    set_code((r, c), empty)
+            shifted_cols.append(c)
+            empty_tops.append((c, write + 1))
+        self._empty_tops = empty_tops
+        return shifted_cols
+
+    def _replace_elements(self) -> list[Coords]:
+        """
+        post: пустые клетки заполнены новыми элементами (построчно)
+        """
+        refilled: list[Coords] = []
+        if self._empty_tops is not None:
+            # only the top cells emptied by the last gravity pass
+            depth = max((count for _, count in self._empty_tops), default=0)
+            for r in range(depth):
+                for c, count in self._empty_tops:
+                    if r < count:
+                        refilled.append((r, c))
+        else:
+            rows, cols = self._board.get_rows(), self._board.get_cols()
+            codes = self._board.get_codes()
+            empty = PieceEnum.X.value
             for r in range(rows):
-                matrix[r][c] = column[r]
+                for c in range(cols):
+                    if codes[r * cols + c] == empty:
+                        refilled.append((r, c))
+        self._empty_tops = None
 
-    def _replace_elements(self) -> None:
-        matrix = self._get_matrix()
-        rows = len(matrix)
-        cols = len(matrix[0])
-
-        for r in range(rows):
-            for c in range(cols):
-                if matrix[r][c]._value == PieceEnum.X:
-                    matrix[r][c].set_random_value()
+        new_codes = self._board.get_rng().draw(len(refilled))
+        for coord, code in zip(refilled, new_codes):
+            self._board.set_code(coord, code)
+        return refilled
 
     def _clear_combs(self) -> None:
         self._combs = []
 
     def _find_combs(self) -> None:
         """
-        post: matched pieces are empty
-        post: score increased
+        post: найдены комбинации в строках и столбцах,
+              изменившихся с прошлого поиска
+        post: линии найденных комбинаций остаются помеченными
         """
-        rows = cols = self._board.get_size()
-        matrix = self._get_matrix()
-
-        # TODO: write it better
-        for r in range(rows):
-            count = 1
-            for c in range(1, cols):
-                if matrix[r][c] == matrix[r][c - 1]:
-                    count += 1
-                else:
-                    if count >= 3:
-                        self._combs.append(
-                            Combination({(r, x) for x in range(c - count, c)})
-                        )
-                    count = 1
-
-            # Check for sequence at the end of the row
-            if count >= 3:
-                self._combs.append(
-                    Combination({(r, x) for x in range(cols - count, cols)})
-                )
-
-        # TODO: write it better
-        for c in range(cols):
-            count = 1
-            for r in range(1, rows):
-                if matrix[r][c] == matrix[r - 1][c]:
-                    count += 1
-                else:
-                    if count >= 3:
-                        self._combs.append(
-                            Combination({(x, c) for x in range(r - count, r)})
-                        )
-                    count = 1
-
-            # Check for sequence at the end of the column
-            if count >= 3:
-                self._combs.append(
-                    Combination({(x, c) for x in range(rows - count, rows)})
-                )
+        rows, cols = self._board.get_rows(), self._board.get_cols()
+        codes = self._board.get_codes()
+        dirty_rows, dirty_cols = self._board.pop_dirty_lines()
+        if (
+            not self._vectorized
+            and self._board.has_eager_bits()
+            and not self._board.get_match_mask()
+        ):
+            # shift-and-AND over the color masks found no run anywhere,
+            # far cheaper than the scalar scan of the dirty lines; on lazy
+            # boards rebuilding the masks costs more than the scan itself
+            return
+        found = len(self._combs)
+
+        if self._vectorized:
+            self._find_combs_vectorized(
+                codes, rows, cols, sorted(dirty_rows), sorted(dirty_cols)
+            )
+        else:
+            for r in sorted(dirty_rows):
+                self._find_row_combs(codes, r, cols)
+            for c in sorted(dirty_cols):
+                self._find_col_combs(codes, c, rows, cols)
+
+        # combinations left on the board must be found again next time
+        for comb in self._combs[found:]:
+            for coord in comb.get_coords():
+                self._board.mark_dirty(coord)
+
+    def _find_row_combs(self, codes: Sequence[int], r: int, cols: int) -> None:
+        base = r * cols
+        count = 1
+        for c in range(1, cols):
+            if codes[base + c] == codes[base + c - 1]:
+                count += 1
+            else:
+                if count >= 3:
+                    self._combs.append(
+                        Combination({(r, x) for x in range(c - count, c)})
+                    )
+                count = 1
+
+        # Check for sequence at the end of the row
+        if count >= 3:
+            self._combs.append(Combination({(r, x) for x in range(cols - count, cols)}))
+
+    def _find_col_combs(
+        self, codes: Sequence[int], c: int, rows: int, cols: int
+    ) -> None:
+        count = 1
+        for r in range(1, rows):
+            if codes[r * cols + c] == codes[(r - 1) * cols + c]:
+                count += 1
+            else:
+                if count >= 3:
+                    self._combs.append(
+                        Combination({(x, c) for x in range(r - count, r)})
+                    )
+                count = 1
+
+        # Check for sequence at the end of the column
+        if count >= 3:
+            self._combs.append(Combination({(x, c) for x in range(rows - count, rows)}))
+
+    def _find_combs_vectorized(
+        self,
+        codes: Sequence[int],
+        rows: int,
+        cols: int,
+        row_lines: list[int],
+        col_lines: list[int],
+    ) -> None:
+        row_runs, col_runs = matcher.find_runs(codes, rows, cols, row_lines, col_lines)
+        for r, start, length in row_runs:
+            self._combs.append(
+                Combination({(r, x) for x in range(start, start + length)})
+            )
+        for c, start, length in col_runs:
+            self._combs.append(
+                Combination({(x, c) for x in range(start, start + length)})
+            )
 
     # query
     def has_matches(self) -> bool:
         return self._combs != []
 
-    def _get_matrix(self):
-        return self._board._matrix
-
 
 class BonusList(Printable):
     """
@@ -520,21 +1381,27 @@ class BonusList(Printable):
     список бонусов, доступных игроку
     """
 
-    # _bonus_list: set[Bonus]
+    # _bonus_list: list[Bonus]
     # _remove_bonus_status: int = -1
 
     # commands
     @abstractmethod
     def add_bouns(self, bonus: Bonus) -> None:
         """
-        post: bonus added to set
+        post: bonus added to the end of the list
         """
 
     @abstractmethod
     def remove_bouns(self, bonus: Bonus) -> None:
         """
         pre : has bonus
-        post: bonus removed from set
+        post: bonus removed from the list
+        """
+
+    @abstractmethod
+    def set_bonuses(self, bonuses: tuple[Bonus, ...]) -> None:
+        """
+        post: список бонусов заменён на bonuses
         """
 
     # query
@@ -542,6 +1409,10 @@ class BonusList(Printable):
     def has_bouns(self, bonus: Bonus) -> bool:
         pass
 
+    @abstractmethod
+    def get_bonuses(self) -> tuple[Bonus, ...]:
+        pass
+
     @abstractmethod
     def get_remove_bonus_status(self) -> int:
         pass
@@ -551,17 +1422,18 @@ class ConcreteBonusList(BonusList):
 
     def __init__(self) -> None:
         super().__init__()
-        self._bonus_list: set[Bonus] = set()
+        # по порядку получения: номер бонуса в команде - позиция + 1
+        self._bonus_list: list[Bonus] = []
         self._remove_bonus_status: int = -1
 
     def render(self) -> None:
-        print("Bonus List: ", sep="")
-        for bonus in self._bonus_list:
-            print(f"{bonus}", sep=", ")
-            print("\n")
+        items = ", ".join(
+            f"b{i} {bonus}" for i, bonus in enumerate(self._bonus_list, 1)
+        )
+        print(f"Bonus List: {items or '-'}")
 
     def add_bouns(self, bonus: Bonus) -> None:
-        self._bonus_list.add(bonus)
+        self._bonus_list.append(bonus)
 
     def remove_bouns(self, bonus: Bonus) -> None:
         if bonus in self._bonus_list:
@@ -570,8 +1442,14 @@ class ConcreteBonusList(BonusList):
             return
         self._remove_bonus_status: int = 0
 
+    def set_bonuses(self, bonuses: tuple[Bonus, ...]) -> None:
+        self._bonus_list = list(bonuses)
+
     def has_bouns(self, bonus: Bonus) -> bool:
         return bonus in self._bonus_list
 
+    def get_bonuses(self) -> tuple[Bonus, ...]:
+        return tuple(self._bonus_list)
+
     def get_remove_bonus_status(self) -> int:
         return self._remove_bonus_status
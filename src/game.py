@@ -1,11 +1,30 @@
+import io
 import os
+import re
 import sys
 from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import redirect_stdout
 from time import sleep
+from typing import Generator, Iterator, NamedTuple
 
 from .elements import *
+from .moves import has_legal_moves, has_room_for_moves, is_legal_swap, reshuffle
+from .render import TerminalRenderer
+from .solver import SearchResult, Solver
 
-State = tuple[Board, Score, BonusList]
+
+class State(NamedTuple):
+    """
+    класс реализации
+    снимок игры: упакованная доска, счёт, бонусы и длина журнала ходов
+    """
+
+    board: bytes
+    score: int
+    bonuses: tuple[Bonus, ...]
+    # ходов в журнале на момент снимка (бонусы журнал не пополняют)
+    moves: int = 0
 
 
 class History(ABC):
@@ -14,34 +33,57 @@ class History(ABC):
     последовательность состояний игры
     """
 
-    _state_list: list[State]
+    _state_list: deque[State]
 
     @abstractmethod
     def add_state(self, state: State) -> None:
         """
         post: added new state to list
+        post: if list is full, the oldest state is dropped
         """
 
     @abstractmethod
     def undo(self) -> None:
         """
+        pre : list is not empty
         post: remove last state from list
         """
 
+    # query
+    @abstractmethod
+    def get_last_state(self) -> State | None:
+        pass
+
 
 class ConcreteHistory(History):
 
-    def __init__(self) -> None:
-        self._state_list: list[State] = []
+    def __init__(self, max_states: int = 100) -> None:
+        self._state_list: deque[State] = deque(maxlen=max_states)
 
     def add_state(self, state: State) -> None:
-        """
-        post: added new state to list
-        """
+        self._state_list.append(state)
 
     def undo(self) -> None:
+        if self._state_list:
+            self._state_list.pop()
+
+    def get_last_state(self) -> State | None:
+        if not self._state_list:
+            return None
+        return self._state_list[-1]
+
+
+class CommandRecorder(ABC):
+    """
+    класс проектирования
+    журнал команд игрока
+    """
+
+    # command
+    @abstractmethod
+    def record(self, command: str, score: int) -> None:
         """
-        post: remove last state from list
+        post: команда и счёт перед её выполнением записаны
         """
 
 
@@ -53,6 +95,7 @@ class Game(ABC):
 
     _game_elements: list[Printable]
     _history: History
+    _headless = False
 
     @abstractmethod
     def render_game(self) -> None:
@@ -60,12 +103,49 @@ class Game(ABC):
         post: game rendered in console
         """
 
+    @abstractmethod
+    def render_status(self) -> None:
+        """
+        post: в консоль выведены все элементы игры, кроме доски
+        """
+
     @abstractmethod
     def add_element(self, element: Printable) -> None:
         """
         post: game rendered in console
         """
 
+    @abstractmethod
+    def set_renderer(self, renderer: FrameRenderer | None) -> None:
+        """
+        post: кадры анимации ходов выводятся через renderer
+        """
+
+    @abstractmethod
+    def set_recorder(self, recorder: CommandRecorder | None) -> None:
+        """
+        post: команды, разобранные CommandDispatcher, записываются в recorder
+        """
+
+    @abstractmethod
+    def save_state(self) -> None:
+        """
+        post: снимок доски, счёта и бонусов добавлен в историю
+        """
+
+    @abstractmethod
+    def undo(self) -> None:
+        """
+        post: игра возвращена к последнему снимку, снимок удалён
+        cannot fail: if history is empty, nothing changes
+        """
+
+    @abstractmethod
+    def log_move(self, coord1: Coords, coord2: Coords) -> None:
+        """
+        post: ход добавлен в журнал ходов
+        """
+
     # query
     @abstractmethod
     def get_game_board(self) -> Board:
@@ -75,31 +155,118 @@ class Game(ABC):
     def get_game_score(self) -> Score:
         pass
 
+    @abstractmethod
+    def get_game_bonus_list(self) -> BonusList:
+        pass
+
+    @abstractmethod
+    def get_move_log(self) -> list[tuple[Coords, Coords]]:
+        """
+        сделанные ходы (обмены) по порядку
+        """
+
+    @abstractmethod
+    def can_undo(self) -> bool:
+        """
+        в истории есть снимок, к которому вернёт undo()
+        """
+
+    def is_headless(self) -> bool:
+        return self._headless
+
+    @abstractmethod
+    def get_renderer(self) -> FrameRenderer | None:
+        pass
+
+    @abstractmethod
+    def get_recorder(self) -> CommandRecorder | None:
+        pass
+
 
 class ConcreteGame(Game):
-    def __init__(self) -> None:
+    def __init__(self, headless: bool = False, max_history: int = 100) -> None:
         self._game_elements: list[Printable] = []
-        self._history: History = ConcreteHistory()
+        self._history: History = ConcreteHistory(max_history)
+        self._move_log: list[tuple[Coords, Coords]] = []
+        # headless: ходы обрабатываются без анимации и вывода на экран
+        self._headless = headless
+        self._renderer: FrameRenderer | None = None
+        self._recorder: CommandRecorder | None = None
+        # тип -> найденный элемент (isinstance с Protocol медленный)
+        self._elements_by_kind: dict[type, Printable] = {}
 
     def add_element(self, element: Printable) -> None:
         self._game_elements.append(element)
+        self._elements_by_kind.clear()
+
+    def set_renderer(self, renderer: FrameRenderer | None) -> None:
+        self._renderer = renderer
+
+    def set_recorder(self, recorder: CommandRecorder | None) -> None:
+        self._recorder = recorder
 
     def render_game(self) -> None:
         for i in self._game_elements:
             i.render()
 
+    def render_status(self) -> None:
+        for i in self._game_elements:
+            if not isinstance(i, Board):
+                i.render()
+
+    def save_state(self) -> None:
+        state = State(
+            self.get_game_board().dump_codes(),
+            self.get_game_score().get_points().value,
+            self.get_game_bonus_list().get_bonuses(),
+            len(self._move_log),
+        )
+        self._history.add_state(state)
+
+    def undo(self) -> None:
+        state = self._history.get_last_state()
+        if state is None:
+            return
+        self.get_game_board().load_codes(state.board)
+        self.get_game_score().set_points(Points(state.score))
+        self.get_game_bonus_list().set_bonuses(state.bonuses)
+        self._history.undo()
+        del self._move_log[state.moves :]
+
+    def log_move(self, coord1: Coords, coord2: Coords) -> None:
+        self._move_log.append((coord1, coord2))
+
+    def get_renderer(self) -> FrameRenderer | None:
+        return self._renderer
+
+    def get_recorder(self) -> CommandRecorder | None:
+        return self._recorder
+
     def get_game_board(self) -> Board:
-        for el in self._game_elements:
-            if isinstance(el, Board):
-                return el
-        raise Exception("Game board not initialized for some reason")
+        return self._get_element(Board)
 
     def get_game_score(self) -> Score:
+        return self._get_element(Score)
+
+    def get_game_bonus_list(self) -> BonusList:
+        return self._get_element(BonusList)
+
+    def _get_element(self, kind: type) -> Printable:
+        element = self._elements_by_kind.get(kind)
+        if element is not None:
+            return element
         for el in self._game_elements:
-            if isinstance(el, Score):
+            if isinstance(el, kind):
+                self._elements_by_kind[kind] = el
                 return el
         raise Exception("Game board not initialized for some reason")
 
+    def get_move_log(self) -> list[tuple[Coords, Coords]]:
+        return self._move_log
+
+    def can_undo(self) -> bool:
+        return self._history.get_last_state() is not None
+
 
 class GameFactory(ABC):
     """
@@ -110,7 +277,13 @@ class GameFactory(ABC):
     # query
     @staticmethod
     @abstractmethod
-    def create_new_game() -> Game:
+    def create_new_game(
+        headless: bool = False,
+        seed: int | None = None,
+        rows: int = 8,
+        cols: int = 8,
+        compact: bool = False,
+    ) -> Game:
         """
         returns new game
         """
@@ -130,50 +303,211 @@ class Command(ABC):
         """
 
 
+# "12" - строка 1, столбец 2; "10:12", "10.12", "10-12", "10 12" - с разделителем
+_COORD_SHORT = re.compile(r"(\d)(\d)")
+_COORD_DELIMITED = re.compile(r"(\d+)\s*[:.\- ]\s*(\d+)")
+
+
+def parse_coords(text: str) -> Coords | None:
+    """
+    координаты клетки из ввода игрока (нумерация с 1)
+    возвращает координаты с 0 или None, если ввод не разобран
+    """
+    text = text.strip()
+    match = _COORD_SHORT.fullmatch(text) or _COORD_DELIMITED.fullmatch(text)
+    if match is None:
+        return None
+    return int(match[1]) - 1, int(match[2]) - 1
+
+
+def format_coords(coord: Coords) -> str:
+    """
+    координаты в виде ввода игрока ("12" или "10:12" для больших досок)
+    """
+    row, col = coord[0] + 1, coord[1] + 1
+    if row < 10 and col < 10:
+        return f"{row}{col}"
+    return f"{row}:{col}"
+
+
 class MoveCommand(Command):
 
-    def __init__(self, board: Board, score: Score, command: str) -> None:
+    def __init__(
+        self,
+        board: Board,
+        score: Score,
+        command: str,
+        headless: bool = False,
+        game: Game | None = None,
+    ) -> None:
         super().__init__()
         self._board = board
         self._score = score
         self._command = command
+        self._headless = headless
+        # игра, в историю которой сохраняется состояние перед ходом
+        self._game = game
+        self._steps: list[CascadeStep] | None = None
+        # причина отказа в ходе (None - ход выполнен или не начат)
+        self._error: str | None = None
+        self._reshuffled = False
 
     def execute(self) -> None:
         """
         post: game updated or ended
         """
+        if not self._start():
+            if not self._headless:
+                InvalidCommand(self._command, msg=self._error).execute()
+            return
+        renderer = self._game.get_renderer() if self._game is not None else None
+        comb_handler = CombHandler(
+            self._board,
+            self._score,
+            headless=self._headless,
+            renderer=renderer,
+            bonus_list=self._get_bonus_list(),
+        )
+        self._steps = comb_handler.play(self._cascade(comb_handler))
+        self._finish()
+        if self._reshuffled and not self._headless:
+            print("No moves left, the board was reshuffled")
+
+        if self._board.get_move_status() == 0:
+            InvalidCommand(self._command, msg="Bad command input").execute()
+
+    def iter_frames(self) -> Iterator[bool]:
+        """
+        ход по кадрам анимации (см. CombHandler.iter_cascade);
+        паузы и отрисовку выполняет вызывающий, сообщения не выводятся
+        """
+        if not self._start():
+            return
+        comb_handler = CombHandler(
+            self._board, self._score, headless=True, bonus_list=self._get_bonus_list()
+        )
+        self._steps = yield from self._cascade(comb_handler)
+        self._finish()
+
+    def _cascade(
+        self, comb_handler: CombHandler
+    ) -> Generator[bool, None, list[CascadeStep]]:
+        return comb_handler.iter_cascade()
+
+    def _start(self) -> bool:
+        """
+        post: допустимый обмен выполнен и записан в историю игры
+        post: иначе причина отказа в self._error
+        """
         args = self._command.split(",")
         str_coord1, str_coord2 = args[0], args[1]
         if not (
             self._validate_coords(str_coord1) and self._validate_coords(str_coord2)
         ):
-            InvalidCommand(self._command).execute()
-            return
-        coord1 = int(str_coord1[0]) - 1, int(str_coord1[1]) - 1
-        coord2 = int(str_coord2[0]) - 1, int(str_coord2[1]) - 1
+            self._error = ""
+            return False
+        coord1 = parse_coords(str_coord1)
+        coord2 = parse_coords(str_coord2)
+        if not is_legal_swap(self._board, coord1, coord2):
+            self._error = "Move does not make a combination"
+            return False
+        if self._game is not None:
+            self._game.save_state()
+            self._game.log_move(coord1, coord2)
         self._board.move(coord1, coord2)
-        comb_handler = CombHandler(self._board, self._score)
-        comb_handler.process_combs()
+        return True
 
-        if self._board.get_move_status == 0:
-            InvalidCommand(self._command, msg="Bad command input").execute()
+    def _finish(self) -> None:
+        self._reshuffled = not has_legal_moves(self._board)
+        if self._reshuffled:
+            reshuffle(self._board)
 
     def _validate_coords(self, str_coord: str) -> bool:
-        if len(str_coord) != 2:
+        coord = parse_coords(str_coord)
+        if coord is None:
             return False
-        board_size = self._board.get_size()
-        if int(str_coord[0]) - 1 < 0 or int(str_coord[0]) > board_size:
+        row, col = coord
+        if row < 0 or row >= self._board.get_rows():
             return False
-        if int(str_coord[1]) - 1 < 0 or int(str_coord[1]) > board_size:
+        if col < 0 or col >= self._board.get_cols():
             return False
         return True
 
+    # query
+    def get_cascade(self) -> list[CascadeStep] | None:
+        """
+        шаги каскада после execute (None, если команда не выполнена)
+        """
+        return self._steps
 
-class BonusCommand(Command):
+    def get_error(self) -> str | None:
+        """
+        причина отказа в ходе (None, если ход выполнен или не начат)
+        """
+        return self._error
 
-    def __init__(self, bonus_list: BonusList) -> None:
-        super().__init__()
-        self._bonus_list = bonus_list
+    def is_reshuffled(self) -> bool:
+        return self._reshuffled
+
+    def _get_bonus_list(self) -> BonusList | None:
+        return self._game.get_game_bonus_list() if self._game is not None else None
+
+
+class BonusCommand(MoveCommand):
+    """
+    класс реализации
+    применение бонусов из списка игрока: "b1 45" - бонус 1 в клетке 45,
+    "b1 45 b2 10:12" - несколько бонусов одним проходом по доске
+    """
+
+    def __init__(self, game: Game, command: str) -> None:
+        super().__init__(
+            game.get_game_board(),
+            game.get_game_score(),
+            command,
+            game.is_headless(),
+            game,
+        )
+        self._activations: list[tuple[Bonus, Coords]] = []
+
+    def _start(self) -> bool:
+        """
+        post: бонусы убраны из списка, состояние записано в историю игры
+        post: иначе причина отказа в self._error
+        """
+        tokens = self._command.split()
+        if not tokens or len(tokens) % 2:
+            self._error = "Use b<number> <cell>, for example b1 45"
+            return False
+        bonus_list = self._game.get_game_bonus_list()
+        bonuses = bonus_list.get_bonuses()
+        activations: list[tuple[Bonus, Coords]] = []
+        used: set[int] = set()
+        for name, cell in zip(tokens[::2], tokens[1::2]):
+            number = name[1:]
+            if not (name.startswith("b") and number.isdigit()):
+                self._error = "Use b<number> <cell>, for example b1 45"
+                return False
+            index = int(number) - 1
+            if not 0 <= index < len(bonuses) or index in used:
+                self._error = f"No bonus {number}"
+                return False
+            if not self._validate_coords(cell):
+                self._error = f"Cell {cell} is not on the board"
+                return False
+            used.add(index)
+            activations.append((bonuses[index], parse_coords(cell)))
+
+        self._game.save_state()
+        for bonus, _ in activations:
+            bonus_list.remove_bouns(bonus)
+        self._activations = activations
+        return True
+
+    def _cascade(
+        self, comb_handler: CombHandler
+    ) -> Generator[bool, None, list[CascadeStep]]:
+        return comb_handler.iter_bonus_cascade(self._activations)
 
 
 class GameCommand(Command):
@@ -183,6 +517,48 @@ class GameCommand(Command):
         self._game = game
 
 
+class UndoCommand(GameCommand):
+    def execute(self) -> None:
+        self._game.undo()
+
+
+class HintCommand(GameCommand):
+    """
+    класс реализации
+    подсказка: лучший ход по оценке Solver
+    """
+
+    def __init__(self, game: Game, solver: Solver | None = None) -> None:
+        super().__init__(game)
+        if solver is None:
+            solver = Solver(max_depth=3, samples=2, time_budget=1.0)
+        self._solver = solver
+        self._result: SearchResult | None = None
+
+    def execute(self) -> None:
+        self._result = self._solver.search(self._game.get_game_board())
+        if self._game.is_headless():
+            return
+        result = self._result
+        if result.move is None:
+            print("No moves left")
+        else:
+            coord1, coord2 = result.move
+            print(
+                f"Hint: {format_coords(coord1)},{format_coords(coord2)}"
+                f" (about {result.value:.1f} points in {result.depth} moves)"
+            )
+        print(
+            f"Searched {result.nodes} nodes in {result.elapsed:.2f} s"
+            f" ({result.nodes_per_sec():.0f} nodes/s, {result.tt_hits} cache hits)"
+        )
+        sleep(3)
+
+    # query
+    def get_result(self) -> SearchResult | None:
+        return self._result
+
+
 class EndGameCommand(Command):
     def execute(self) -> None:
         sys.exit(0)
@@ -195,24 +571,48 @@ class InvalidCommand(Command):
         self._msg = msg
 
     def execute(self) -> None:
-        print(f'Command "{self._command}" is invalid, please try again')
-        print(self._msg)
+        print(self.get_message())
         sleep(1)
 
+    # query
+    def get_message(self) -> str:
+        return f'Command "{self._command}" is invalid, please try again\n{self._msg}'
+
 
 class ConcreteGameFactory(GameFactory):
 
     @staticmethod
-    def create_new_game() -> ConcreteGame:
-        game = ConcreteGame()
-        board = ConcreteBoard8X8()
+    def create_new_game(
+        headless: bool = False,
+        seed: int | None = None,
+        rows: int = 8,
+        cols: int = 8,
+        compact: bool = False,
+    ) -> ConcreteGame:
+        """
+        pre : has_room_for_moves(rows, cols)
+        compact: доска в одном bytearray (для больших досок)
+        """
+        if not has_room_for_moves(rows, cols):
+            raise ValueError(f"A {rows}x{cols} board has no possible moves")
+        game = ConcreteGame(headless)
+        rng = PieceRNG(seed)
+        board: Board
+        if compact:
+            board = CompactBoard(rows, cols, rng)
+        elif rows == cols == 8:
+            board = ConcreteBoard8X8(rng)
+        else:
+            board = ConcreteBoard(rows, cols, rng)
         score = ConcreteScore()
         bonus_list = ConcreteBonusList()
         game.add_element(board)
         game.add_element(score)
         game.add_element(bonus_list)
-        algo = CombHandler(board, score)
+        algo = CombHandler(board, score, headless=headless)
         algo.prepare_board()
+        if not has_legal_moves(board):
+            reshuffle(board)
         return game
 
 
@@ -229,13 +629,25 @@ class CommandDispatcher(AbsCommandDispatcher):
         self._game = game
 
     def process_command(self) -> Command:
+        recorder = self._game.get_recorder()
+        if recorder is not None:
+            score = self._game.get_game_score().get_points().value
+            recorder.record(self._command, score)
         if self._command == "q":
             return EndGameCommand()
+        if self._command == "u":
+            return UndoCommand(self._game)
+        if self._command == "h":
+            return HintCommand(self._game)
+        if self._command.startswith("b"):
+            return BonusCommand(self._game, self._command)
         args = self._command.split(",")
-        if len(args) == 2 and args[0].isdigit() and args[1].isdigit():
+        if len(args) == 2 and all(parse_coords(arg) is not None for arg in args):
             board = self._game.get_game_board()
             score = self._game.get_game_score()
-            return MoveCommand(board, score, self._command)
+            return MoveCommand(
+                board, score, self._command, self._game.is_headless(), self._game
+            )
         return InvalidCommand(self._command)
 
 
@@ -251,18 +663,28 @@ class AbsGameLoop(ABC):
 
 class GameLoop(AbsGameLoop, Printable):
 
+    def __init__(self, game: Game, renderer: FrameRenderer | None = None) -> None:
+        super().__init__(game)
+        self._renderer = renderer if renderer is not None else TerminalRenderer()
+        self._game.set_renderer(self._renderer)
+
     def run_game_loop(self):
         while True:
-            self.clear_screen()
-            self._game.render_game()
+            self._renderer.draw(self._game.get_game_board(), self._status_text())
             command = self._get_player_input()
             cmd = CommandDispatcher(command, self._game).process_command()
             cmd.execute()
 
+    def _status_text(self) -> str:
+        buffer = io.StringIO()
+        with redirect_stdout(buffer):
+            self._game.render_status()
+        return buffer.getvalue()
+
     def _get_player_input(self):
         command = (
             input(
-                'Enter command ("[row][col],[row][col]" to swap elements (11,12 for example), q to quit): '
+                'Enter command ("[row][col],[row][col]" to swap elements (11,12 or 10:12,11:12 for example), b1 45 to use bonus 1 on cell 45, u to undo, h for a hint, q to quit): '
             )
             .strip()
             .lower()
@@ -0,0 +1,125 @@
+"""
+Генератор нагрузки для игрового сервера: много одновременных клиентов,
+каждый делает допустимые ходы и замеряет время ответа.
+"""
+
+import asyncio
+import statistics
+from time import perf_counter
+
+from .elements import CompactBoard, Printable
+from .game import format_coords
+from .moves import find_move
+from .rng import PieceRNG
+
+# цифра ASCII -> код клетки
+_CODES = bytes.maketrans(b"01234567", bytes(range(8)))
+
+
+class LoadReport(Printable):
+    """
+    класс реализации
+    задержки и пропускная способность по всем клиентам
+    """
+
+    def __init__(
+        self, sessions: int, latencies: list[float], errors: int, elapsed: float
+    ) -> None:
+        self._sessions = sessions
+        self._latencies = latencies
+        self._errors = errors
+        self._elapsed = elapsed
+
+    def render(self) -> None:
+        report = self.to_dict()
+        print(f"Sessions: {report['sessions']}, commands: {report['commands']}")
+        print(f"Errors: {report['errors']}")
+        print(f"Throughput: {report['throughput']:.1f} commands/s")
+        print(
+            "Latency ms: "
+            + ", ".join(f"{key} {report[key]:.2f}" for key in ("p50", "p90", "p99"))
+            + f", max {report['max']:.2f}"
+        )
+
+    # query
+    def percentile(self, p: float) -> float:
+        if not self._latencies:
+            return 0.0
+        ordered = sorted(self._latencies)
+        index = min(len(ordered) - 1, int(p / 100 * len(ordered)))
+        return ordered[index]
+
+    def to_dict(self) -> dict:
+        commands = len(self._latencies)
+        return {
+            "sessions": self._sessions,
+            "commands": commands,
+            "errors": self._errors,
+            "elapsed": self._elapsed,
+            "throughput": commands / self._elapsed if self._elapsed else 0.0,
+            "mean": statistics.fmean(self._latencies) * 1e3 if commands else 0.0,
+            "p50": self.percentile(50) * 1e3,
+            "p90": self.percentile(90) * 1e3,
+            "p99": self.percentile(99) * 1e3,
+            "max": max(self._latencies, default=0.0) * 1e3,
+        }
+
+
+def parse_frame(line: bytes) -> tuple[int, CompactBoard]:
+    """
+    счёт и доска из текстового ответа "ok <счёт> <строки> <столбцы> <клетки>"
+    """
+    _, score, rows, cols, cells = line.split()
+    board = CompactBoard(int(rows), int(cols), rng=PieceRNG(0))
+    board.load_codes(cells.translate(_CODES))
+    return int(score), board
+
+
+async def _client(host: str, port: int, moves: int, latencies: list[float]) -> int:
+    """
+    одна сессия: moves ходов подряд; возвращает количество ошибок
+    """
+    errors = 0
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        line = await reader.readline()
+        if not line.startswith(b"ok"):
+            return 1
+        _, board = parse_frame(line)
+        for _ in range(moves):
+            move = find_move(board)
+            if move is None:
+                break
+            command = ",".join(map(format_coords, move))
+            start = perf_counter()
+            writer.write(f"{command}\n".encode())
+            await writer.drain()
+            line = await reader.readline()
+            latencies.append(perf_counter() - start)
+            if not line.startswith(b"ok"):
+                errors += 1
+                break
+            _, board = parse_frame(line)
+        writer.write(b"q\n")
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return errors
+
+
+async def run_load(
+    host: str, port: int, sessions: int = 100, moves: int = 20
+) -> LoadReport:
+    """
+    sessions одновременных клиентов по moves ходов каждый
+    """
+    latencies: list[float] = []
+    start = perf_counter()
+    results = await asyncio.gather(
+        *(_client(host, port, moves, latencies) for _ in range(sessions)),
+        return_exceptions=True,
+    )
+    elapsed = perf_counter() - start
+    errors = sum(r if isinstance(r, int) else 1 for r in results)
+    return LoadReport(sessions, latencies, errors, elapsed)
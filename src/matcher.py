@@ -0,0 +1,67 @@
+"""
+Векторизованный поиск комбинаций на доске (NumPy).
+NumPy - необязательная зависимость: без неё CombHandler
+использует обычный построчный поиск.
+"""
+
+from typing import Sequence
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+HAS_NUMPY = np is not None
+
+# (номер строки/столбца, индекс первой клетки, длина)
+Run = tuple[int, int, int]
+
+
+def find_runs(
+    codes: Sequence[int],
+    rows: int,
+    cols: int,
+    row_lines: list[int] | None = None,
+    col_lines: list[int] | None = None,
+) -> tuple[list[Run], list[Run]]:
+    """
+    pre : NumPy установлен
+    возвращает ряды из 3 и более одинаковых элементов:
+    горизонтальные (по строкам) и вертикальные (по столбцам),
+    в том же порядке, что и построчный поиск
+    row_lines, col_lines - проверять только эти строки/столбцы (по возрастанию)
+    """
+    if isinstance(codes, (bytes, bytearray, memoryview)):
+        grid = np.frombuffer(codes, dtype=np.uint8)
+    else:
+        grid = np.fromiter(codes, dtype=np.uint8, count=rows * cols)
+    grid = grid.reshape(rows, cols)
+    return _line_runs(grid, row_lines), _line_runs(grid.T, col_lines)
+
+
+def _line_runs(grid, lines: list[int] | None = None) -> list[Run]:
+    if lines is not None:
+        if not lines:
+            return []
+        grid = grid[lines]
+    width = grid.shape[1]
+    if width < 3:
+        return []
+    # same[l, i] - клетки i и i + 1 линии l совпадают
+    same = grid[:, 1:] == grid[:, :-1]
+    padded = np.zeros((grid.shape[0], width + 1), dtype=np.int8)
+    padded[:, 1:-1] = same
+    edges = np.diff(padded, axis=1)
+    line_idx, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    lengths = ends - starts + 1
+    keep = lengths >= 3
+    if lines is not None:
+        line_idx = np.asarray(lines)[line_idx]
+    return list(
+        zip(
+            line_idx[keep].tolist(),
+            starts[keep].tolist(),
+            lengths[keep].tolist(),
+        )
+    )
@@ -0,0 +1,300 @@
+from collections import OrderedDict
+from typing import Iterable, Sequence
+
+from . import bitboard
+from .elements import ZOBRIST_CODES, Board, CascadeStep, Coords, PieceEnum
+
+Swap = tuple[Coords, Coords]
+
+
+def is_legal_swap(board: Board, coord1: Coords, coord2: Coords) -> bool:
+    """
+    обмен соседних клеток даёт ряд из 3 и более элементов
+    (проверяются только клетки рядом с обменом, без полного поиска)
+    """
+    row1, col1 = coord1
+    row2, col2 = coord2
+    if abs(row1 - row2) + abs(col1 - col2) != 1:
+        return False
+    rows, cols = board.get_rows(), board.get_cols()
+    if min(row1, row2, col1, col2) < 0 or max(row1, row2) >= rows:
+        return False
+    if max(col1, col2) >= cols:
+        return False
+    return _swap_makes_run(board.get_codes(), rows, cols, coord1, coord2)
+
+
+def generate_moves(board: Board) -> list[Swap]:
+    """
+    все обмены соседних клеток, дающие комбинацию
+    """
+    rows, cols = board.get_rows(), board.get_cols()
+    codes = board.get_codes()
+    moves: list[Swap] = []
+    for r in range(rows):
+        for c in range(cols):
+            right = (r, c + 1)
+            if c + 1 < cols and _swap_makes_run(codes, rows, cols, (r, c), right):
+                moves.append(((r, c), right))
+            down = (r + 1, c)
+            if r + 1 < rows and _swap_makes_run(codes, rows, cols, (r, c), down):
+                moves.append(((r, c), down))
+    return moves
+
+
+# количество позиций в кэшах find_move и has_legal_moves
+MOVE_CACHE_SIZE = 4096
+_move_cache: OrderedDict[tuple[int, int, int], Swap | None] = OrderedDict()
+_legal_cache: OrderedDict[tuple[int, int, int], bool] = OrderedDict()
+
+
+def find_move(board: Board) -> Swap | None:
+    """
+    первый (по порядку generate_moves) допустимый ход или None
+    результат кэшируется по хэшу Zobrist доски
+    """
+    rows, cols = board.get_rows(), board.get_cols()
+    key = (board.get_hash(), rows, cols)
+    if key in _move_cache:
+        _move_cache.move_to_end(key)
+        return _move_cache[key]
+    move = _first_move(board.get_codes(), rows, cols)
+    _remember(_move_cache, key, move)
+    return move
+
+
+def has_legal_moves(board: Board) -> bool:
+    """
+    есть хотя бы один допустимый ход (сдвиги и AND масок цветов доски)
+    результат кэшируется по хэшу Zobrist доски
+    """
+    rows, cols = board.get_rows(), board.get_cols()
+    key = (board.get_hash(), rows, cols)
+    if key in _legal_cache:
+        _legal_cache.move_to_end(key)
+        return _legal_cache[key]
+    legal = any(
+        bitboard.move_targets(board.get_color_mask(code), rows, cols)
+        for code in range(ZOBRIST_CODES)
+    )
+    _remember(_legal_cache, key, legal)
+    return legal
+
+
+def _remember(cache: OrderedDict, key: tuple[int, int, int], value) -> None:
+    cache[key] = value
+    if len(cache) > MOVE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def _first_move(codes: Sequence[int], rows: int, cols: int) -> Swap | None:
+    for r in range(rows):
+        for c in range(cols):
+            right = (r, c + 1)
+            if c + 1 < cols and _swap_makes_run(codes, rows, cols, (r, c), right):
+                return (r, c), right
+            down = (r + 1, c)
+            if r + 1 < rows and _swap_makes_run(codes, rows, cols, (r, c), down):
+                return (r, c), down
+    return None
+
+
+def has_room_for_moves(rows: int, cols: int) -> bool:
+    """
+    на доске rows x cols возможен хоть один допустимый ход: ряд из 3 и
+    соседняя линия, откуда придёт третий элемент, или линия из 4 клеток
+    """
+    length, width = max(rows, cols), min(rows, cols)
+    return width >= 1 and (length >= 4 or length >= 3 and width >= 2)
+
+
+def reshuffle(board: Board) -> Swap:
+    """
+    pre : has_room_for_moves(rows, cols), не меньше 4 цветов
+    post: доска заполнена заново без комбинаций и с допустимым ходом
+    возвращает гарантированный ход
+    """
+    rows, cols = board.get_rows(), board.get_cols()
+    if not has_room_for_moves(rows, cols):
+        raise ValueError(f"A {rows}x{cols} board has no possible moves")
+    rng = board.get_rng()
+    colors = rng.get_colors()
+    empty = PieceEnum.X.value
+    codes = bytearray(rows * cols)
+
+    # plant a move first, along the rows when there is room for it and
+    # along the columns otherwise: (across, along) below is (row, col) or
+    # (col, row) respectively
+    horizontal = cols >= 3 and rows >= 2 or rows == 1
+    length, width = (cols, rows) if horizontal else (rows, cols)
+    if width >= 2 and length >= 3:
+        # a pair and a third piece diagonally next to it, e.g. (r, c)
+        # (r, c+1) and (r+1, c+2); swapping (r, c+2) with (r+1, c+2)
+        # completes the run
+        across = rng.next_index(width - 1)
+        along = rng.next_index(length - 2)
+        planted = [(across, along), (across, along + 1), (across + 1, along + 2)]
+        swap = (across, along + 2), (across + 1, along + 2)
+    else:
+        # a single line: (c) (c+1) (c+3), swapping c+2 with c+3
+        across = 0
+        along = rng.next_index(length - 3)
+        planted = [(across, along), (across, along + 1), (across, along + 3)]
+        swap = (across, along + 2), (across, along + 3)
+    if not horizontal:
+        planted = [(r, c) for c, r in planted]
+        swap = (swap[0][1], swap[0][0]), (swap[1][1], swap[1][0])
+    code = 1 + rng.next_index(colors)
+    for r, c in planted:
+        codes[r * cols + c] = code
+
+    # every other cell gets a color that does not complete a run with the
+    # cells already set, so one pass fills the board without re-rolls
+    # (only the left pair, the upper pair and the planted color can be
+    # excluded, hence the 4 colors precondition)
+    for r in range(rows):
+        for c in range(cols):
+            i = r * cols + c
+            if codes[i] != empty:
+                continue
+            options = [
+                x
+                for x in range(1, colors + 1)
+                if not _makes_run(codes, rows, cols, (r, c), x, (r, c))
+            ]
+            codes[i] = options[rng.next_index(len(options))]
+
+    board.load_codes(bytes(codes))
+    return swap
+
+
+def _swap_makes_run(
+    codes: Sequence[int], rows: int, cols: int, coord1: Coords, coord2: Coords
+) -> bool:
+    code1 = codes[coord1[0] * cols + coord1[1]]
+    code2 = codes[coord2[0] * cols + coord2[1]]
+    if code1 == code2:
+        return False
+    return _makes_run(codes, rows, cols, coord2, code1, coord1) or _makes_run(
+        codes, rows, cols, coord1, code2, coord2
+    )
+
+
+def _makes_run(
+    codes: Sequence[int],
+    rows: int,
+    cols: int,
+    coord: Coords,
+    code: int,
+    partner: Coords,
+) -> bool:
+    """
+    элемент code, поставленный в coord, образует ряд из 3
+    (в клетке partner после обмена стоит другой элемент)
+    """
+    row, col = coord
+    skip = partner[0] * cols + partner[1]
+
+    count = 1
+    for c in (col - 1, col - 2):
+        i = row * cols + c
+        if c < 0 or i == skip or codes[i] != code:
+            break
+        count += 1
+    for c in (col + 1, col + 2):
+        i = row * cols + c
+        if c >= cols or i == skip or codes[i] != code:
+            break
+        count += 1
+    if count >= 3:
+        return True
+
+    count = 1
+    for r in (row - 1, row - 2):
+        i = r * cols + col
+        if r < 0 or i == skip or codes[i] != code:
+            break
+        count += 1
+    for r in (row + 1, row + 2):
+        i = r * cols + col
+        if r >= rows or i == skip or codes[i] != code:
+            break
+        count += 1
+    return count >= 3
+
+
+class MoveGenerator:
+    """
+    класс реализации
+    индекс допустимых ходов, обновляемый только вокруг изменённых клеток
+    """
+
+    def __init__(self, board: Board) -> None:
+        self._board = board
+        self._moves: set[Swap] = set(generate_moves(board))
+
+    # command
+    def update(self, cells: Iterable[Coords]) -> None:
+        """
+        post: пересчитаны ходы, на которые влияют изменённые клетки
+        """
+        rows, cols = self._board.get_rows(), self._board.get_cols()
+        codes = self._board.get_codes()
+        ends: set[Coords] = set()
+        for row, col in cells:
+            # a swap depends only on cells within 2 along its row/column
+            for d in range(-2, 3):
+                if 0 <= row + d < rows:
+                    ends.add((row + d, col))
+                if 0 <= col + d < cols:
+                    ends.add((row, col + d))
+
+        swaps: set[Swap] = set()
+        for row, col in ends:
+            if col + 1 < cols:
+                swaps.add(((row, col), (row, col + 1)))
+            if col > 0:
+                swaps.add(((row, col - 1), (row, col)))
+            if row + 1 < rows:
+                swaps.add(((row, col), (row + 1, col)))
+            if row > 0:
+                swaps.add(((row - 1, col), (row, col)))
+
+        for swap in swaps:
+            if _swap_makes_run(codes, rows, cols, *swap):
+                self._moves.add(swap)
+            else:
+                self._moves.discard(swap)
+
+    def update_after_move(self, swap: Swap, steps: list[CascadeStep]) -> None:
+        """
+        post: индекс соответствует доске после обмена swap и его каскада
+        """
+        changed: set[Coords] = set(swap)
+        for step in steps:
+            lowest: dict[int, int] = {}
+            for row, col in step.removed:
+                lowest[col] = max(row, lowest.get(col, -1))
+            # gravity rewrites a column from the top down to its lowest hole
+            for col in step.shifted_cols:
+                for row in range(lowest.get(col, -1) + 1):
+                    changed.add((row, col))
+        self.update(changed)
+
+    def rebuild(self) -> None:
+        """
+        post: индекс построен заново по всей доске
+        """
+        self._moves = set(generate_moves(self._board))
+
+    # query
+    def has_moves(self) -> bool:
+        return bool(self._moves)
+
+    def get_moves(self) -> list[Swap]:
+        return sorted(self._moves)
+
+    def is_legal(self, coord1: Coords, coord2: Coords) -> bool:
+        if coord2 < coord1:
+            coord1, coord2 = coord2, coord1
+        return (coord1, coord2) in self._moves
@@ -0,0 +1,213 @@
+"""
+Необязательная инструментация горячих участков: счётчики и гистограммы
+времени фаз CombHandler, хода и отрисовки доски, а также запись cProfile.
+
+Пока инструментация выключена, методы классов не изменены, поэтому
+накладных расходов нет; enable() подменяет их обёртками с замером
+времени, disable() возвращает исходные.
+"""
+
+import atexit
+import cProfile
+import json
+import pstats
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Iterator
+
+from .elements import CombHandler, CompactBoard, ConcreteBoard
+from .render import TerminalRenderer
+
+# счётчик по результату метода: имя и функция результат -> приращение
+ResultCounter = tuple[str, Callable[[object], int]]
+# класс, метод и счётчик по результату или None
+Target = tuple[type, str, ResultCounter | None]
+
+TARGETS: tuple[Target, ...] = (
+    (CombHandler, "_find_combs", None),
+    (CombHandler, "_remove_elements", ("removed_cells", len)),
+    (CombHandler, "_shift_elements", ("shifted_cols", len)),
+    (CombHandler, "_replace_elements", ("refilled_cells", len)),
+    (CombHandler, "_update_score", ("points", lambda points: points.value)),
+    (ConcreteBoard, "move", None),
+    (CompactBoard, "move", None),
+    (ConcreteBoard, "render", None),
+    (CompactBoard, "render", None),
+    (TerminalRenderer, "draw", None),
+)
+
+
+class LatencyHistogram:
+    """
+    класс реализации
+    время вызовов: количество, сумма, минимум, максимум
+    и корзины по степеням двойки микросекунд
+    """
+
+    def __init__(self) -> None:
+        self._count = 0
+        self._total = 0.0
+        self._min = float("inf")
+        self._max = 0.0
+        # номер корзины -> количество; корзина k - до 2 ** k мкс
+        self._buckets: dict[int, int] = {}
+
+    # command
+    def add(self, seconds: float) -> None:
+        self._count += 1
+        self._total += seconds
+        if seconds < self._min:
+            self._min = seconds
+        if seconds > self._max:
+            self._max = seconds
+        bucket = int(seconds * 1e6).bit_length()
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + 1
+
+    # query
+    def get_count(self) -> int:
+        return self._count
+
+    def percentile(self, p: float) -> float:
+        """
+        верхняя граница корзины, в которую попадает p-й процентиль (мкс)
+        """
+        if not self._count:
+            return 0.0
+        rank = p / 100 * self._count
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= rank:
+                return float(2**bucket)
+        return self._max * 1e6
+
+    def to_dict(self) -> dict:
+        if not self._count:
+            return {"count": 0}
+        return {
+            "count": self._count,
+            "total_ms": self._total * 1e3,
+            "mean_us": self._total / self._count * 1e6,
+            "min_us": self._min * 1e6,
+            "max_us": self._max * 1e6,
+            "p50_us": self.percentile(50),
+            "p90_us": self.percentile(90),
+            "p99_us": self.percentile(99),
+            "buckets_us": {
+                str(2**bucket): count for bucket, count in sorted(self._buckets.items())
+            },
+        }
+
+
+class Instrumentation:
+    """
+    класс реализации
+    счётчики и гистограммы времени для методов из TARGETS
+    """
+
+    def __init__(self, targets: tuple[Target, ...] = TARGETS) -> None:
+        self._targets = targets
+        self._originals: dict[tuple[type, str], Callable] = {}
+        self._histograms: dict[str, LatencyHistogram] = {}
+        self._counters: dict[str, int] = {}
+        self._export_path: str | None = None
+
+    # command
+    def enable(self, export_path: str | None = None) -> None:
+        """
+        post: методы из TARGETS замеряются
+        post: если задан export_path, сводка записывается туда при выходе
+        """
+        for cls, name, counter in self._targets:
+            if (cls, name) in self._originals:
+                continue
+            original = cls.__dict__[name]
+            self._originals[(cls, name)] = original
+            setattr(cls, name, self._wrap(f"{cls.__name__}.{name}", original, counter))
+        if export_path is not None and self._export_path is None:
+            atexit.register(self._export_at_exit)
+        self._export_path = export_path
+
+    def disable(self) -> None:
+        """
+        post: исходные методы восстановлены (собранные данные сохраняются)
+        """
+        for (cls, name), original in self._originals.items():
+            setattr(cls, name, original)
+        self._originals.clear()
+
+    def reset(self) -> None:
+        self._histograms.clear()
+        self._counters.clear()
+
+    def count(self, name: str, value: int = 1) -> None:
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name: str, seconds: float) -> None:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            histogram = self._histograms[name] = LatencyHistogram()
+        histogram.add(seconds)
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def _wrap(
+        self, label: str, method: Callable, counter: ResultCounter | None
+    ) -> Callable:
+        record, count = self.record, self.count
+
+        @wraps(method)
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            result = method(*args, **kwargs)
+            record(label, perf_counter() - start)
+            if counter is not None:
+                count(counter[0], counter[1](result))
+            return result
+
+        return timed
+
+    def _export_at_exit(self) -> None:
+        if self._export_path is not None:
+            self.save(self._export_path)
+
+    # query
+    def is_enabled(self) -> bool:
+        return bool(self._originals)
+
+    def summary(self) -> dict:
+        return {
+            "counters": dict(sorted(self._counters.items())),
+            "timings": {
+                name: histogram.to_dict()
+                for name, histogram in sorted(self._histograms.items())
+            },
+        }
+
+
+# общий экземпляр для main.py и отладки
+instrumentation = Instrumentation()
+
+
+@contextmanager
+def profile_session(
+    path: str | None = None, top: int = 0
+) -> Iterator[cProfile.Profile]:
+    """
+    запись cProfile на время блока with
+    path - файл для pstats/snakeviz, top - вывести столько самых
+    дорогих функций (по суммарному времени) после блока
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        if top:
+            pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
@@ -0,0 +1,86 @@
+"""
+Вывод доски в терминал без очистки экрана: кадр собирается в один буфер,
+а после первого кадра перерисовываются только изменившиеся клетки
+(позиционирование курсора ANSI).
+"""
+
+import sys
+from typing import TextIO
+
+from .elements import GLYPH_TABLES, Board, FrameRenderer, GlyphMode
+
+CURSOR_HOME = "\033[H"
+CLEAR_SCREEN = "\033[2J"
+CLEAR_BELOW = "\033[J"
+
+# отрисованный элемент для каждого кода клетки (цветной режим)
+GLYPHS = GLYPH_TABLES[GlyphMode.COLOR]
+
+
+def move_cursor(line: int, column: int) -> str:
+    return f"\033[{line};{column}H"
+
+
+class TerminalRenderer(FrameRenderer):
+    """
+    класс реализации
+    вывод кадров одним sys.stdout.write с перерисовкой только изменений
+    """
+
+    def __init__(self, out: TextIO | None = None) -> None:
+        self._out = out if out is not None else sys.stdout
+        # состояние доски в последнем выведенном кадре
+        self._shown: bytes | None = None
+        self._shape: tuple[int, int, GlyphMode] | None = None
+        self._footer: str | None = None
+        self._repainted = 0
+
+    # command
+    def draw(self, board: Board, footer: str | None = None) -> None:
+        codes = board.dump_codes()
+        # a new glyph mode changes the layout as well: repaint everything
+        shape = board.get_rows(), board.get_cols(), board.get_glyph_mode()
+        parts: list[str] = []
+        if self._shown is None or self._shape != shape:
+            parts.append(CURSOR_HOME + CLEAR_SCREEN + board.format_frame(codes))
+            self._repainted = len(codes)
+            self._footer = None
+        else:
+            cols = shape[1]
+            shown = self._shown
+            glyphs = board.get_glyphs()
+            changed = [i for i in range(len(codes)) if codes[i] != shown[i]]
+            for i in changed:
+                line, column = board.get_cell_position(divmod(i, cols))
+                parts.append(move_cursor(line, column) + glyphs[codes[i]])
+            self._repainted = len(changed)
+
+        footer_line = board.get_frame_height() + 1
+        if footer is not None and footer != self._footer:
+            parts.append(move_cursor(footer_line, 1) + CLEAR_BELOW + footer)
+            self._footer = footer
+        elif footer is not None:
+            # keep the footer, drop whatever was typed or printed below it
+            end = footer_line + footer.count("\n")
+            parts.append(move_cursor(end, 1 + _last_line_width(footer)) + CLEAR_BELOW)
+        else:
+            parts.append(move_cursor(footer_line, 1))
+
+        self._shown, self._shape = codes, shape
+        self._out.write("".join(parts))
+        self._out.flush()
+
+    def invalidate(self) -> None:
+        self._shown = None
+        self._footer = None
+
+    # query
+    def get_repainted(self) -> int:
+        """
+        количество клеток, выведенных в последнем кадре
+        """
+        return self._repainted
+
+
+def _last_line_width(text: str) -> int:
+    return len(text) - text.rfind("\n") - 1
@@ -0,0 +1,238 @@
+"""
+Запись команд игрока и проверка партий повторным воспроизведением.
+
+Журнал - текстовый файл, строки только дописываются (в одном файле
+может быть несколько партий подряд):
+    game <seed> <строки> <столбцы>        начало партии
+    cmd <счёт перед командой> <команда>    каждая команда CommandDispatcher
+    end <счёт>                            итог (при закрытии записи)
+"""
+
+import os
+from multiprocessing import Pool
+from time import perf_counter
+from typing import Generator, Iterable, Iterator, NamedTuple, TextIO
+
+from .elements import CascadeStep, Printable
+from .game import (
+    CommandDispatcher,
+    CommandRecorder,
+    ConcreteGameFactory,
+    EndGameCommand,
+    Game,
+    HintCommand,
+    InvalidCommand,
+    MoveCommand,
+    UndoCommand,
+)
+from .storage import FormatError
+
+
+class ReplayRecorder(CommandRecorder):
+    """
+    класс реализации
+    дописывает команды партии в журнал; каждая строка сразу сбрасывается
+    на диск, поэтому журнал прерванной партии тоже можно воспроизвести
+    """
+
+    def __init__(self, path: str, game: Game) -> None:
+        """
+        pre : игра только что создана с явным seed
+        """
+        board = game.get_game_board()
+        seed = board.get_rng().get_seed()
+        if seed is None:
+            raise ValueError("Only a game created with a seed can be replayed")
+        self._file: TextIO = open(path, "a", buffering=1)
+        self._file.write(f"game {seed} {board.get_rows()} {board.get_cols()}\n")
+
+    # command
+    def record(self, command: str, score: int) -> None:
+        self._file.write(f"cmd {score} {command}\n")
+
+    def close(self, score: int | None = None) -> None:
+        """
+        post: записан итоговый счёт (если задан), файл закрыт
+        """
+        if self._file.closed:
+            return
+        if score is not None:
+            self._file.write(f"end {score}\n")
+        self._file.close()
+
+
+class ReplayLog(NamedTuple):
+    seed: int
+    rows: int
+    cols: int
+    # (счёт перед командой, команда)
+    commands: list[tuple[int, str]]
+    # итоговый счёт; None - запись не была закрыта
+    score: int | None
+
+
+class ReplayResult(NamedTuple):
+    seed: int
+    commands: int
+    # счёт после воспроизведения
+    score: int
+    expected: int | None
+    # номер первой команды, перед которой счёт разошёлся с записью
+    mismatch: int | None
+
+    def is_ok(self) -> bool:
+        if self.mismatch is not None:
+            return False
+        return self.expected is None or self.expected == self.score
+
+
+def parse_log(lines: Iterable[str]) -> Iterator[ReplayLog]:
+    """
+    партии журнала по порядку
+    """
+    header: tuple[int, int, int] | None = None
+    commands: list[tuple[int, str]] = []
+    for number, line in enumerate(lines, 1):
+        kind, _, rest = line.rstrip("\n").partition(" ")
+        if kind == "game":
+            if header is not None:
+                yield ReplayLog(*header, commands, None)
+            seed, rows, cols = map(int, rest.split())
+            header, commands = (seed, rows, cols), []
+        elif header is None:
+            raise FormatError(f"Line {number}: command before the game header")
+        elif kind == "cmd":
+            score, _, command = rest.partition(" ")
+            commands.append((int(score), command))
+        elif kind == "end":
+            yield ReplayLog(*header, commands, int(rest))
+            header = None
+        elif kind:
+            raise FormatError(f"Line {number}: unknown record {kind!r}")
+    if header is not None:
+        yield ReplayLog(*header, commands, None)
+
+
+def read_log(path: str) -> list[ReplayLog]:
+    with open(path) as file:
+        return list(parse_log(file))
+
+
+def iter_replay(
+    log: ReplayLog,
+) -> Generator[list[CascadeStep] | None, None, ReplayResult]:
+    """
+    повторяет команды партии без анимации, вывода и ввода:
+    шаги каскада каждого выполненного хода или бонуса; None - отмена
+    последнего ещё не отменённого хода или бонуса (команда "u");
+    в конце - итог со сверкой счёта перед каждой командой и в конце
+    """
+    # the compact board plays exactly like the 8x8 one and is faster
+    game = ConcreteGameFactory.create_new_game(
+        headless=True, seed=log.seed, rows=log.rows, cols=log.cols, compact=True
+    )
+    score = game.get_game_score()
+    for index, (expected, command) in enumerate(log.commands):
+        current = score.get_points().value
+        if current != expected:
+            return ReplayResult(log.seed, index, current, log.score, index)
+        cmd = CommandDispatcher(command, game).process_command()
+        if isinstance(cmd, EndGameCommand):
+            break
+        # hints and invalid input do not change the game: skip the search
+        # and the message pauses
+        if isinstance(cmd, (HintCommand, InvalidCommand)):
+            continue
+        # every executed move or bonus saved one state, so an undo that
+        # restores a state reverts exactly the latest of them
+        undone = isinstance(cmd, UndoCommand) and game.can_undo()
+        cmd.execute()
+        if undone:
+            yield None
+        elif isinstance(cmd, MoveCommand) and cmd.get_cascade() is not None:
+            yield cmd.get_cascade()
+    final = score.get_points().value
+    return ReplayResult(log.seed, len(log.commands), final, log.score, None)
+
+
+def replay_game(log: ReplayLog) -> ReplayResult:
+    moves = iter_replay(log)
+    while True:
+        try:
+            next(moves)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _replay_file(path: str) -> list[ReplayResult]:
+    return [replay_game(log) for log in read_log(path)]
+
+
+class VerificationReport(Printable):
+    """
+    класс реализации
+    итог проверки журналов
+    """
+
+    def __init__(self, results: dict[str, list[ReplayResult]], elapsed: float) -> None:
+        self._results = results
+        self._elapsed = elapsed
+
+    def render(self) -> None:
+        report = self.to_dict()
+        print(
+            f"Replays: {report['games']} in {report['files']} files, "
+            f"{report['games_per_sec']:.0f} games/s"
+        )
+        print(f"Failed: {len(report['failed'])}")
+        for item in report["failed"]:
+            print(
+                f"  {item['file']} game {item['game']} (seed {item['seed']}): "
+                f"score {item['score']}, expected {item['expected']}"
+                + (
+                    f", diverged before command {item['mismatch']}"
+                    if item["mismatch"] is not None
+                    else ""
+                )
+            )
+
+    # query
+    def get_results(self) -> dict[str, list[ReplayResult]]:
+        return self._results
+
+    def is_ok(self) -> bool:
+        return all(r.is_ok() for results in self._results.values() for r in results)
+
+    def to_dict(self) -> dict:
+        games = sum(len(results) for results in self._results.values())
+        failed = [
+            {"file": path, "game": index, **result._asdict()}
+            for path, results in self._results.items()
+            for index, result in enumerate(results)
+            if not result.is_ok()
+        ]
+        return {
+            "files": len(self._results),
+            "games": games,
+            "elapsed": self._elapsed,
+            "games_per_sec": games / self._elapsed if self._elapsed else 0.0,
+            "failed": failed,
+        }
+
+
+def verify_files(paths: list[str], workers: int | None = None) -> VerificationReport:
+    """
+    воспроизводит все партии журналов paths; файлы распределяются по
+    workers процессам (None - по числу процессоров)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    start = perf_counter()
+    if workers <= 1 or len(paths) <= 1:
+        parts = list(map(_replay_file, paths))
+    else:
+        with Pool(min(workers, len(paths))) as pool:
+            parts = pool.map(
+                _replay_file, paths, chunksize=max(1, len(paths) // (4 * workers))
+            )
+    return VerificationReport(dict(zip(paths, parts)), perf_counter() - start)
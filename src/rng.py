@@ -0,0 +1,59 @@
+"""
+Генератор случайных элементов доски с собственным состоянием.
+"""
+
+import random
+
+
+class PieceRNG:
+    """
+    класс реализации
+    генератор значений PieceEnum (1..colors) для одной игры
+    """
+
+    def __init__(self, seed: int | None = None, colors: int = 5) -> None:
+        self._seed = seed
+        self._colors = colors
+        self._random = random.Random(seed)
+        # random byte -> code; bytes above the last full cycle are dropped
+        # so every code stays equally likely
+        limit = 256 - 256 % colors
+        self._table = bytes(b % colors + 1 if b < limit else 0 for b in range(256))
+        self._rejected = bytes(range(limit, 256))
+
+    # command
+    def draw(self, count: int) -> bytes:
+        """
+        post: возвращает count случайных кодов элементов
+        """
+        if count <= 0:
+            return b""
+        result = b""
+        while len(result) < count:
+            need = count - len(result)
+            size = need + need // 16 + 4
+            chunk = self._random.getrandbits(size * 8).to_bytes(size, "little")
+            result += chunk.translate(self._table, self._rejected)
+        return result[:count]
+
+    def next_code(self) -> int:
+        return self.draw(1)[0]
+
+    def next_index(self, count: int) -> int:
+        """
+        post: возвращает случайное число от 0 до count - 1
+        """
+        return self._random.randrange(count)
+
+    def set_state(self, state: tuple) -> None:
+        self._random.setstate(state)
+
+    # query
+    def get_seed(self) -> int | None:
+        return self._seed
+
+    def get_state(self) -> tuple:
+        return self._random.getstate()
+
+    def get_colors(self) -> int:
+        return self._colors
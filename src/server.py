@@ -0,0 +1,309 @@
+"""
+Игровой сервер asyncio: отдельная игра на каждое TCP-соединение.
+
+Клиент отправляет строки, завершённые "\\n":
+    "11,12", "10:12,11:12"  ход (синтаксис CommandDispatcher)
+    "u"                     отменить ход
+    "h"                     подсказка
+    "text" / "binary"       формат ответов (по умолчанию text)
+    "q"                     завершить сессию
+
+Ответ в формате text - одна строка:
+    "ok <счёт> <строки> <столбцы> <коды клеток цифрами построчно>"
+    "hint <ход>" или "err <сообщение>"
+
+Ответ в формате binary - кадр:
+    varint  длина кадра (без этого поля)
+    byte    тип: FRAME_OK, FRAME_ERROR или FRAME_HINT
+    FRAME_OK:   varint счёт, varint строки, varint столбцы,
+                клетки по 3 бита (storage.pack_cells)
+    остальные:  текст UTF-8
+"""
+
+import asyncio
+from typing import NamedTuple
+
+from .game import (
+    CommandDispatcher,
+    ConcreteGameFactory,
+    Game,
+    HintCommand,
+    InvalidCommand,
+    MoveCommand,
+    format_coords,
+)
+from .solver import Solver
+from .storage import pack_cells, write_varint
+
+FRAME_OK = 0
+FRAME_ERROR = 1
+FRAME_HINT = 2
+
+# код клетки -> цифра ASCII
+_DIGITS = bytes.maketrans(bytes(range(8)), b"01234567")
+
+
+class SessionLimits(NamedTuple):
+    """
+    класс реализации
+    ограничения одной сессии
+    """
+
+    # максимальная длина строки команды
+    max_line: int = 64
+    # команд в секунду в среднем и допустимый всплеск
+    rate: float = 50.0
+    burst: int = 100
+    # секунд без команд до закрытия соединения
+    idle_timeout: float = 300.0
+    # ходов за сессию
+    max_moves: int = 10_000
+
+
+class ServerStats(NamedTuple):
+    sessions: int
+    peak_sessions: int
+    total_sessions: int
+    commands: int
+    rejected: int
+
+
+class Session:
+    """
+    класс реализации
+    состояние одного игрока: игра, формат ответов и учёт ограничений
+    """
+
+    def __init__(self, game: Game, limits: SessionLimits = SessionLimits()) -> None:
+        self._game = game
+        self._limits = limits
+        self._binary = False
+        self._moves = 0
+        self._tokens = float(limits.burst)
+        self._last_refill: float | None = None
+        self._solver = Solver(max_depth=2, samples=1, time_budget=0.2)
+
+    # command
+    def handle(self, line: str) -> bytes | None:
+        """
+        ответ на команду; None - сессию нужно закрыть
+        """
+        command = line.strip().lower()
+        if command == "q":
+            return None
+        if command in ("text", "binary"):
+            self._binary = command == "binary"
+            return self.frame()
+        if command == "h":
+            cmd = HintCommand(self._game, self._solver)
+            cmd.execute()
+            move = cmd.get_result().move
+            if move is None:
+                return self.error("no moves left")
+            return self._message(FRAME_HINT, "hint", ",".join(map(format_coords, move)))
+
+        cmd = CommandDispatcher(command, self._game).process_command()
+        if isinstance(cmd, MoveCommand):
+            if self._moves >= self._limits.max_moves:
+                return self.error("move limit reached")
+            cmd.execute()
+            if cmd.get_error() is not None:
+                return self.error(cmd.get_error() or "invalid move")
+            self._moves += 1
+        elif isinstance(cmd, InvalidCommand):
+            return self.error(f"unknown command {command!r}")
+        else:
+            cmd.execute()
+        return self.frame()
+
+    def allow(self, now: float) -> bool:
+        """
+        post: команда учтена, если не превышен лимит частоты (token bucket)
+        """
+        if self._last_refill is not None:
+            elapsed = now - self._last_refill
+            self._tokens = min(
+                self._limits.burst, self._tokens + elapsed * self._limits.rate
+            )
+        self._last_refill = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    # query
+    def frame(self) -> bytes:
+        board = self._game.get_game_board()
+        codes = board.dump_codes()
+        score = self._game.get_game_score().get_points().value
+        rows, cols = board.get_rows(), board.get_cols()
+        if not self._binary:
+            cells = codes.translate(_DIGITS).decode()
+            return f"ok {score} {rows} {cols} {cells}\n".encode()
+        body = bytearray([FRAME_OK])
+        write_varint(body, score)
+        write_varint(body, rows)
+        write_varint(body, cols)
+        body += pack_cells(codes)
+        return _with_length(body)
+
+    def error(self, message: str) -> bytes:
+        return self._message(FRAME_ERROR, "err", message)
+
+    def _message(self, kind: int, word: str, text: str) -> bytes:
+        if not self._binary:
+            return f"{word} {text}\n".encode()
+        return _with_length(bytes([kind]) + text.encode())
+
+
+def _with_length(body: bytes | bytearray) -> bytes:
+    frame = bytearray()
+    write_varint(frame, len(body))
+    return bytes(frame + body)
+
+
+class GameServer:
+    """
+    класс реализации
+    TCP-сервер: сессия и игра (без анимации) на каждое соединение
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        limits: SessionLimits = SessionLimits(),
+        max_sessions: int = 10_000,
+        seed: int | None = None,
+    ) -> None:
+        """
+        port 0 - выбирается свободный порт (см. get_port)
+        seed - игры получают seed, seed + 1, ... (None - случайные)
+        """
+        self._host = host
+        self._port = port
+        self._limits = limits
+        self._max_sessions = max_sessions
+        self._next_seed = seed
+        self._server: asyncio.Server | None = None
+        self._sessions = 0
+        self._peak_sessions = 0
+        self._total_sessions = 0
+        self._commands = 0
+        self._rejected = 0
+        self._tasks: set[asyncio.Task] = set()
+
+    # command
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(
+            self._handle,
+            self._host,
+            self._port,
+            limit=self._limits.max_line,
+            # let a burst of clients connect at once instead of retrying SYNs
+            backlog=min(self._max_sessions, 4096),
+        )
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self) -> None:
+        """
+        post: новые соединения не принимаются, открытые сессии закрыты
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        if self._sessions >= self._max_sessions:
+            self._rejected += 1
+            writer.write(b"err server is full\n")
+            await _close(writer)
+            return
+
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        self._sessions += 1
+        self._total_sessions += 1
+        self._peak_sessions = max(self._peak_sessions, self._sessions)
+        loop = asyncio.get_running_loop()
+        try:
+            session = Session(self._new_game(), self._limits)
+            writer.write(session.frame())
+            await writer.drain()
+            while True:
+                try:
+                    line = await asyncio.wait_for(
+                        reader.readline(), self._limits.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    writer.write(session.error("idle timeout"))
+                    break
+                except (asyncio.LimitOverrunError, ValueError):
+                    writer.write(session.error("line too long"))
+                    break
+                if not line:
+                    break
+
+                self._commands += 1
+                if not session.allow(loop.time()):
+                    writer.write(session.error("rate limit exceeded"))
+                    await writer.drain()
+                    continue
+                text = line.decode(errors="replace")
+                if text.strip().lower() == "h":
+                    # the search is CPU bound, do not stall other sessions
+                    response = await asyncio.to_thread(session.handle, text)
+                else:
+                    response = session.handle(text)
+                if response is None:
+                    break
+                writer.write(response)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._sessions -= 1
+            self._tasks.discard(task)
+            await _close(writer)
+
+    def _new_game(self) -> Game:
+        seed = self._next_seed
+        if seed is not None:
+            self._next_seed = seed + 1
+        return ConcreteGameFactory.create_new_game(
+            headless=True, seed=seed, compact=True
+        )
+
+    # query
+    def get_port(self) -> int:
+        """
+        pre : сервер запущен
+        """
+        return self._server.sockets[0].getsockname()[1]
+
+    def get_stats(self) -> ServerStats:
+        return ServerStats(
+            self._sessions,
+            self._peak_sessions,
+            self._total_sessions,
+            self._commands,
+            self._rejected,
+        )
+
+
+async def _close(writer: asyncio.StreamWriter) -> None:
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except ConnectionError:
+        pass
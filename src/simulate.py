@@ -0,0 +1,223 @@
+"""
+Пакетная симуляция игр: много партий без UI, распределённых по процессам.
+"""
+
+import random
+import statistics
+from abc import ABC, abstractmethod
+from collections import Counter
+from multiprocessing import Pool
+from typing import Generator, NamedTuple
+
+from .elements import Board, CascadeStep, CombHandler, ConcreteScore, Printable
+from .game import ConcreteGameFactory
+from .moves import MoveGenerator, Swap
+from .solver import SearchStats, Solver
+
+
+class MovePolicy(ABC):
+    """
+    класс проектирования
+    выбор хода из списка допустимых
+    """
+
+    name: str
+
+    # query
+    @abstractmethod
+    def choose_move(self, board: Board, moves: list[Swap], rng: random.Random) -> Swap:
+        """
+        pre : moves не пуст
+        """
+
+
+class RandomPolicy(MovePolicy):
+    name = "random"
+
+    def choose_move(self, board: Board, moves: list[Swap], rng: random.Random) -> Swap:
+        return rng.choice(moves)
+
+
+class GreedyPolicy(MovePolicy):
+    """
+    ход с наибольшим количеством очков за первую комбинацию
+    (каскад не учитывается)
+    """
+
+    name = "greedy"
+
+    def choose_move(self, board: Board, moves: list[Swap], rng: random.Random) -> Swap:
+        best_points = -1
+        best: list[Swap] = []
+        for coord1, coord2 in moves:
+            board._swap(coord1, coord2)
+            handler = CombHandler(board, ConcreteScore(), headless=True)
+            handler._find_combs()
+            points = sum(c.get_score_points().value for c in handler._combs)
+            board._swap(coord1, coord2)
+            if points > best_points:
+                best_points = points
+                best = [(coord1, coord2)]
+            elif points == best_points:
+                best.append((coord1, coord2))
+        return rng.choice(best)
+
+
+class SolverPolicy(MovePolicy):
+    """
+    ход, выбранный поиском Solver (без ограничения по времени,
+    чтобы результат симуляции зависел только от seed)
+    """
+
+    name = "solver"
+
+    def __init__(self, max_depth: int = 2, samples: int = 1) -> None:
+        self._solver = Solver(max_depth=max_depth, samples=samples)
+
+    def choose_move(self, board: Board, moves: list[Swap], rng: random.Random) -> Swap:
+        move = self._solver.search(board).move
+        return move if move is not None else rng.choice(moves)
+
+    # query
+    def get_stats(self) -> SearchStats:
+        return self._solver.get_stats()
+
+
+POLICIES: dict[str, type[MovePolicy]] = {
+    RandomPolicy.name: RandomPolicy,
+    GreedyPolicy.name: GreedyPolicy,
+    SolverPolicy.name: SolverPolicy,
+}
+
+
+class GameResult(NamedTuple):
+    seed: int
+    score: int
+    moves: int
+    # количество шагов каскада для каждого хода
+    cascade_depths: list[int]
+
+
+def iter_game(
+    seed: int, policy: MovePolicy, max_moves: int = 100
+) -> Generator[list[CascadeStep], None, GameResult]:
+    """
+    партия по ходам до отсутствия ходов или max_moves ходов:
+    шаги каскада каждого хода, в конце - итог партии
+    """
+    rng = random.Random(f"{seed}-policy")
+    game = ConcreteGameFactory.create_new_game(headless=True, seed=seed)
+    board = game.get_game_board()
+    score = game.get_game_score()
+    handler = CombHandler(board, score, headless=True)
+    generator = MoveGenerator(board)
+
+    depths: list[int] = []
+    while len(depths) < max_moves and generator.has_moves():
+        move = policy.choose_move(board, generator.get_moves(), rng)
+        game.log_move(*move)
+        board.move(*move)
+        steps = handler.process_combs()
+        generator.update_after_move(move, steps)
+        depths.append(len(steps))
+        yield steps
+    return GameResult(seed, score._score.value, len(depths), depths)
+
+
+def play_game(seed: int, policy: MovePolicy, max_moves: int = 100) -> GameResult:
+    """
+    сыграть одну партию до отсутствия ходов или max_moves ходов
+    """
+    moves = iter_game(seed, policy, max_moves)
+    while True:
+        try:
+            next(moves)
+        except StopIteration as stop:
+            return stop.value
+
+
+def _play_chunk(args: tuple[list[int], str, int]) -> list[GameResult]:
+    seeds, policy_name, max_moves = args
+    policy = POLICIES[policy_name]()
+    return [play_game(seed, policy, max_moves) for seed in seeds]
+
+
+class SimulationReport(Printable):
+    """
+    класс реализации
+    сводка по сыгранным партиям
+    """
+
+    def __init__(self, results: list[GameResult]) -> None:
+        self._results = results
+
+    def render(self) -> None:
+        report = self.to_dict()
+        print(f"Games: {report['games']}")
+        for key in ("score", "moves"):
+            stats = report[key]
+            print(
+                f"{key.capitalize()}: mean {stats['mean']:.2f}, "
+                f"stdev {stats['stdev']:.2f}, min {stats['min']}, "
+                f"median {stats['median']}, max {stats['max']}"
+            )
+        print(f"Cascade depth: {report['cascade_depth']}")
+
+    # query
+    def get_results(self) -> list[GameResult]:
+        return self._results
+
+    def to_dict(self) -> dict:
+        scores = [r.score for r in self._results]
+        moves = [r.moves for r in self._results]
+        depths = Counter(d for r in self._results for d in r.cascade_depths)
+        return {
+            "games": len(self._results),
+            "score": _describe(scores),
+            "moves": _describe(moves),
+            "score_histogram": dict(sorted(Counter(scores).items())),
+            "cascade_depth": dict(sorted(depths.items())),
+        }
+
+
+def _describe(values: list[int]) -> dict:
+    if not values:
+        return {"mean": 0.0, "stdev": 0.0, "min": 0, "median": 0, "max": 0}
+    return {
+        "mean": statistics.fmean(values),
+        "stdev": statistics.pstdev(values),
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values),
+    }
+
+
+def game_seeds(master_seed: int, games: int) -> list[int]:
+    rng = random.Random(master_seed)
+    return [rng.getrandbits(63) for _ in range(games)]
+
+
+def simulate(
+    games: int,
+    policy: str = RandomPolicy.name,
+    master_seed: int = 0,
+    workers: int = 1,
+    max_moves: int = 100,
+    chunk_size: int = 16,
+) -> SimulationReport:
+    """
+    сыграть games партий политикой policy
+    каждая партия получает свой seed из master_seed, поэтому результат
+    не зависит от количества процессов
+    """
+    seeds = game_seeds(master_seed, games)
+    chunks = [
+        (seeds[i : i + chunk_size], policy, max_moves)
+        for i in range(0, games, chunk_size)
+    ]
+    if workers <= 1:
+        parts = map(_play_chunk, chunks)
+        return SimulationReport([r for part in parts for r in part])
+    with Pool(workers) as pool:
+        parts = pool.imap(_play_chunk, chunks)
+        return SimulationReport([r for part in parts for r in part])
@@ -0,0 +1,227 @@
+"""
+Поиск лучшего хода (expectimax) для подсказок и автоигры.
+
+Узлы выбора - допустимые обмены, случайные узлы - заполнение доски после
+каскада. Заполнение не угадать, поэтому для каждого хода разыгрывается
+несколько вариантов с разными генераторами и берётся среднее количество
+очков. Seed варианта зависит только от позиции и хода, так что поиск
+детерминирован и позиции можно кэшировать в таблице транспозиций.
+"""
+
+from collections import OrderedDict
+from time import perf_counter
+from typing import NamedTuple
+
+from .elements import Board, CombHandler, CompactBoard, ConcreteScore
+from .moves import Swap, generate_moves
+from .rng import PieceRNG
+
+# (хэш Zobrist, строки, столбцы, оставшаяся глубина)
+TTKey = tuple[int, int, int, int]
+
+
+class SearchResult(NamedTuple):
+    """
+    класс реализации
+    результат поиска для одной позиции
+    """
+
+    move: Swap | None
+    # ожидаемое количество очков на глубину depth
+    value: float
+    # глубина последней полностью завершённой итерации
+    depth: int
+    nodes: int
+    tt_hits: int
+    elapsed: float
+
+    def nodes_per_sec(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+class SearchStats(NamedTuple):
+    """
+    класс реализации
+    суммарная статистика всех поисков одного Solver
+    """
+
+    searches: int
+    nodes: int
+    tt_hits: int
+    elapsed: float
+
+    def nodes_per_sec(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed else 0.0
+
+
+class TranspositionTable:
+    """
+    класс реализации
+    кэш оценок позиций ограниченного размера (вытесняются давно не нужные)
+    """
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self._max_entries = max_entries
+        self._entries: OrderedDict[TTKey, tuple[float, Swap | None]] = OrderedDict()
+
+    # command
+    def put(self, key: TTKey, entry: tuple[float, Swap | None]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    # query
+    def get(self, key: TTKey) -> tuple[float, Swap | None] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Solver:
+    """
+    класс реализации
+    expectimax с итеративным углублением, таблицей транспозиций
+    и ограничением по времени
+    """
+
+    def __init__(
+        self,
+        max_depth: int = 2,
+        samples: int = 2,
+        time_budget: float | None = None,
+        tt_size: int = 100_000,
+        discount: float = 1.0,
+    ) -> None:
+        """
+        time_budget - секунды на поиск; None - без ограничения
+        (тогда результат зависит только от позиции)
+        """
+        self._max_depth = max_depth
+        self._samples = samples
+        self._time_budget = time_budget
+        self._discount = discount
+        self._table = TranspositionTable(tt_size)
+        # доска для разыгрывания ходов на каждом уровне поиска
+        self._scratch: list[CompactBoard] = []
+        self._deadline: float | None = None
+        self._nodes = 0
+        self._tt_hits = 0
+        self._stats = SearchStats(0, 0, 0, 0.0)
+
+    # command
+    def search(self, board: Board) -> SearchResult:
+        """
+        post: возвращён лучший найденный ход (None, если ходов нет)
+        post: глубина 1 просчитывается всегда, даже если время вышло
+        """
+        start = perf_counter()
+        rows, cols = board.get_rows(), board.get_cols()
+        self._prepare_scratch(rows, cols)
+        self._nodes = self._tt_hits = 0
+        codes, position = board.dump_codes(), board.get_hash()
+
+        value, move, depth = 0.0, None, 0
+        for iteration in range(1, self._max_depth + 1):
+            self._deadline = None
+            if iteration > 1 and self._time_budget is not None:
+                self._deadline = start + self._time_budget
+            try:
+                value, move = self._expand(codes, position, iteration, 0)
+            except _Timeout:
+                break
+            depth = iteration
+            if move is None:
+                break
+
+        elapsed = perf_counter() - start
+        stats = self._stats
+        self._stats = SearchStats(
+            stats.searches + 1,
+            stats.nodes + self._nodes,
+            stats.tt_hits + self._tt_hits,
+            stats.elapsed + elapsed,
+        )
+        return SearchResult(move, value, depth, self._nodes, self._tt_hits, elapsed)
+
+    def _prepare_scratch(self, rows: int, cols: int) -> None:
+        if self._scratch and (
+            self._scratch[0].get_rows() != rows or self._scratch[0].get_cols() != cols
+        ):
+            self._scratch = []
+        while len(self._scratch) < self._max_depth:
+            self._scratch.append(CompactBoard(rows, cols, rng=PieceRNG(0)))
+
+    def _expand(
+        self, codes: bytes, position: int, depth: int, level: int
+    ) -> tuple[float, Swap | None]:
+        """
+        лучший ход и его ожидаемая ценность для позиции codes
+        """
+        board = self._scratch[level]
+        key = (position, board.get_rows(), board.get_cols(), depth)
+        entry = self._table.get(key)
+        if entry is not None:
+            self._tt_hits += 1
+            return entry
+
+        board.load_codes(codes)
+        best_value, best_move = 0.0, None
+        for move in generate_moves(board):
+            total = 0.0
+            for sample in range(self._samples):
+                total += self._play(board, codes, position, move, sample, depth, level)
+            value = total / self._samples
+            if best_move is None or value > best_value:
+                best_value, best_move = value, move
+
+        entry = (best_value, best_move)
+        self._table.put(key, entry)
+        return entry
+
+    def _play(
+        self,
+        board: CompactBoard,
+        codes: bytes,
+        position: int,
+        move: Swap,
+        sample: int,
+        depth: int,
+        level: int,
+    ) -> float:
+        """
+        очки за ход move в одном варианте заполнения (с продолжением поиска)
+        """
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise _Timeout
+        self._nodes += 1
+        board.load_codes(codes)
+        board.set_rng(PieceRNG(hash((position, move, sample))))
+        board._swap(*move)
+        score = ConcreteScore()
+        CombHandler(board, score, headless=True).process_combs()
+        points = float(score.get_points().value)
+        if depth > 1:
+            child, _ = self._expand(
+                board.dump_codes(), board.get_hash(), depth - 1, level + 1
+            )
+            points += self._discount * child
+        return points
+
+    # query
+    def get_stats(self) -> SearchStats:
+        return self._stats
+
+    def get_table_size(self) -> int:
+        return len(self._table)
@@ -0,0 +1,346 @@
+"""
+Потоковая статистика по сыгранным или воспроизведённым партиям.
+
+Ходы и партии поступают из генератора и сразу сворачиваются в сводки
+постоянного размера (счётчики, гистограммы, скетчи квантилей), поэтому
+память не зависит от количества партий. Сводки из разных процессов
+объединяются через merge.
+"""
+
+import math
+import os
+from collections import Counter
+from multiprocessing import Pool
+from typing import Iterable, Iterator, NamedTuple, Self
+
+from .elements import PIECES, CascadeStep, Match, Printable
+from .replay import iter_replay, read_log
+from .simulate import POLICIES, game_seeds, iter_game
+
+
+class MoveSummary(NamedTuple):
+    """
+    класс реализации
+    итог одного хода (без координат клеток)
+    """
+
+    depth: int
+    points: int
+    matches: tuple[Match, ...]
+
+    @classmethod
+    def from_steps(cls, steps: list[CascadeStep]) -> "MoveSummary":
+        points = sum(step.points.value for step in steps)
+        matches = tuple(match for step in steps for match in step.matches)
+        return cls(len(steps), points, matches)
+
+
+class GameSummary(NamedTuple):
+    seed: int
+    score: int
+    moves: int
+
+
+Event = MoveSummary | GameSummary
+
+
+class QuantileSketch:
+    """
+    класс реализации
+    приближённые квантили неотрицательных значений: значения
+    собираются в корзины [gamma^(k-1), gamma^k), поэтому ответ
+    отличается от точного не больше чем в accuracy раз, а память
+    растёт как логарифм диапазона значений
+    """
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self._accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self._buckets: Counter[int] = Counter()
+        self._zeros = 0
+        self._count = 0
+
+    # command
+    def add(self, value: float) -> None:
+        self._count += 1
+        if value <= 0:
+            self._zeros += 1
+            return
+        self._buckets[math.ceil(math.log(value) / self._log_gamma)] += 1
+
+    def merge(self, other: "QuantileSketch") -> None:
+        """
+        pre : у other та же точность
+        """
+        if other._accuracy != self._accuracy:
+            raise ValueError("Cannot merge sketches of different accuracy")
+        self._buckets.update(other._buckets)
+        self._zeros += other._zeros
+        self._count += other._count
+
+    # query
+    def quantile(self, q: float) -> float:
+        if not self._count:
+            return 0.0
+        rank = q * (self._count - 1)
+        seen = self._zeros
+        if rank < seen:
+            return 0.0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen > rank:
+                # the middle of the bucket in relative terms
+                return 2 * self._gamma**bucket / (self._gamma + 1)
+        return 2 * self._gamma ** max(self._buckets) / (self._gamma + 1)
+
+    def get_count(self) -> int:
+        return self._count
+
+
+class Distribution:
+    """
+    класс реализации
+    количество, среднее, разброс, минимум, максимум и квантили
+    """
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self._count = 0
+        self._mean = 0.0
+        # сумма квадратов отклонений от среднего (алгоритм Уэлфорда)
+        self._m2 = 0.0
+        self._min = math.inf
+        self._max = -math.inf
+        self._sketch = QuantileSketch(accuracy)
+
+    # command
+    def add(self, value: float) -> None:
+        self._count += 1
+        delta = value - self._mean
+        self._mean += delta / self._count
+        self._m2 += delta * (value - self._mean)
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        self._sketch.add(value)
+
+    def merge(self, other: "Distribution") -> None:
+        if not other._count:
+            return
+        count = self._count + other._count
+        delta = other._mean - self._mean
+        self._m2 += other._m2 + delta * delta * self._count * other._count / count
+        self._mean += delta * other._count / count
+        self._count = count
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        self._sketch.merge(other._sketch)
+
+    # query
+    def to_dict(self) -> dict:
+        if not self._count:
+            return {"count": 0}
+
+        def quantile(q: float) -> float:
+            # the bucket middle may fall outside the observed range
+            return min(max(self._sketch.quantile(q), self._min), self._max)
+
+        return {
+            "count": self._count,
+            "mean": round(self._mean, 3),
+            "stdev": round(math.sqrt(self._m2 / self._count), 3),
+            "min": self._min,
+            "p50": round(quantile(0.5), 1),
+            "p90": round(quantile(0.9), 1),
+            "p99": round(quantile(0.99), 1),
+            "max": self._max,
+        }
+
+
+class StatsAggregator(Printable):
+    """
+    класс реализации
+    сводка по потоку ходов и партий
+    """
+
+    def __init__(self, accuracy: float = 0.01) -> None:
+        self._scores = Distribution(accuracy)
+        self._game_moves = Distribution(accuracy)
+        self._move_points = Distribution(accuracy)
+        self._depths: Counter[int] = Counter()
+        # длина комбинации -> количество и сумма очков
+        self._match_counts: Counter[int] = Counter()
+        self._match_points: Counter[int] = Counter()
+        # код элемента -> элементов в комбинациях
+        self._colors: Counter[int] = Counter()
+
+    def render(self) -> None:
+        report = self.to_dict()
+        print(f"Games: {report['games']}, moves: {report['moves']}")
+        for key in ("score", "moves_per_game", "points_per_move"):
+            stats = report[key]
+            if not stats["count"]:
+                continue
+            print(
+                f"{key.replace('_', ' ').capitalize()}: mean {stats['mean']}, "
+                f"stdev {stats['stdev']}, p50 {stats['p50']}, p90 {stats['p90']}, "
+                f"p99 {stats['p99']}, max {stats['max']}"
+            )
+        print(f"Cascade depth: {report['cascade_depth']}")
+        print(
+            "Combinations: "
+            + ", ".join(
+                f"{length}: {item['count']} ({item['points']} points)"
+                for length, item in report["combinations"].items()
+            )
+        )
+        print(f"Colors: {report['colors']}")
+
+    # command
+    def add_move(self, move: MoveSummary) -> None:
+        self._move_points.add(move.points)
+        self._depths[move.depth] += 1
+        for match in move.matches:
+            self._match_counts[match.length] += 1
+            self._match_points[match.length] += match.points
+            self._colors[match.code] += match.length
+
+    def add_game(self, game: GameSummary) -> None:
+        self._scores.add(game.score)
+        self._game_moves.add(game.moves)
+
+    def consume(self, events: Iterable[Event]) -> Self:
+        """
+        post: учтены все события потока (по одному, без списка)
+        """
+        add_move, add_game = self.add_move, self.add_game
+        for event in events:
+            if isinstance(event, MoveSummary):
+                add_move(event)
+            else:
+                add_game(event)
+        return self
+
+    def merge(self, other: "StatsAggregator") -> Self:
+        """
+        post: учтены события other (например, из другого процесса)
+        """
+        self._scores.merge(other._scores)
+        self._game_moves.merge(other._game_moves)
+        self._move_points.merge(other._move_points)
+        self._depths.update(other._depths)
+        self._match_counts.update(other._match_counts)
+        self._match_points.update(other._match_points)
+        self._colors.update(other._colors)
+        return self
+
+    # query
+    def to_dict(self) -> dict:
+        return {
+            "games": self._scores.to_dict()["count"],
+            "moves": sum(self._depths.values()),
+            "score": self._scores.to_dict(),
+            "moves_per_game": self._game_moves.to_dict(),
+            "points_per_move": self._move_points.to_dict(),
+            "cascade_depth": dict(sorted(self._depths.items())),
+            "combinations": {
+                length: {"count": count, "points": self._match_points[length]}
+                for length, count in sorted(self._match_counts.items())
+            },
+            "colors": {
+                PIECES[code].name: count for code, count in sorted(self._colors.items())
+            },
+        }
+
+
+def iter_simulated(
+    seeds: Iterable[int], policy: str = "random", max_moves: int = 100
+) -> Iterator[Event]:
+    """
+    события партий, сыгранных политикой policy
+    """
+    player = POLICIES[policy]()
+    for seed in seeds:
+        moves = iter_game(seed, player, max_moves)
+        while True:
+            try:
+                steps = next(moves)
+            except StopIteration as stop:
+                result = stop.value
+                break
+            yield MoveSummary.from_steps(steps)
+        yield GameSummary(seed, result.score, result.moves)
+
+
+def iter_replayed(paths: Iterable[str]) -> Iterator[Event]:
+    """
+    события партий из журналов ReplayRecorder; ходы, отменённые
+    командой "u", не учитываются
+    """
+    for path in paths:
+        for log in read_log(path):
+            moves = iter_replay(log)
+            # an undo can revert any earlier move, so the moves of a game
+            # are emitted once it is over
+            kept: list[MoveSummary] = []
+            while True:
+                try:
+                    steps = next(moves)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                if steps is None:
+                    kept.pop()
+                else:
+                    kept.append(MoveSummary.from_steps(steps))
+            yield from kept
+            yield GameSummary(log.seed, result.score, len(kept))
+
+
+def _simulated_chunk(args: tuple[list[int], str, int]) -> StatsAggregator:
+    seeds, policy, max_moves = args
+    return StatsAggregator().consume(iter_simulated(seeds, policy, max_moves))
+
+
+def _replayed_file(path: str) -> StatsAggregator:
+    return StatsAggregator().consume(iter_replayed([path]))
+
+
+def aggregate_simulation(
+    games: int,
+    policy: str = "random",
+    master_seed: int = 0,
+    workers: int = 1,
+    max_moves: int = 100,
+    chunk_size: int = 16,
+) -> StatsAggregator:
+    """
+    статистика games партий (те же seed, что и у simulate);
+    каждый процесс сворачивает свои партии, сводки объединяются
+    """
+    seeds = game_seeds(master_seed, games)
+    chunks = (
+        (seeds[i : i + chunk_size], policy, max_moves)
+        for i in range(0, games, chunk_size)
+    )
+    return _merge_parts(_simulated_chunk, chunks, workers)
+
+
+def aggregate_replays(paths: list[str], workers: int | None = None) -> StatsAggregator:
+    """
+    статистика партий журналов paths (workers=None - по числу процессоров)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    return _merge_parts(_replayed_file, paths, min(workers, len(paths)))
+
+
+def _merge_parts(func, items: Iterable, workers: int) -> StatsAggregator:
+    total = StatsAggregator()
+    if workers <= 1:
+        for item in items:
+            total.merge(func(item))
+        return total
+    with Pool(workers) as pool:
+        for part in pool.imap_unordered(func, items):
+            total.merge(part)
+    return total
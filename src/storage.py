@@ -0,0 +1,307 @@
+"""
+Компактный двоичный формат сохранения игр и архив партий.
+
+Запись игры:
+    varint  длина записи (без этого поля)
+    byte    флаги (FLAG_SEED, FLAG_RNG_STATE)
+    varint  строки, varint столбцы
+    bytes   доска, 3 бита на клетку (8 клеток в 3 байтах)
+    varint  счёт
+    varint  количество бонусов, для каждого: varint длина + имя класса
+    varint  seed                        (если FLAG_SEED)
+    625 x uint32 состояние генератора   (если FLAG_RNG_STATE)
+    varint  количество ходов, для каждого: varint (клетка << 1 | вниз)
+"""
+
+import mmap
+import struct
+from typing import Iterator
+
+from .elements import (
+    Bonus,
+    CompactBoard,
+    ConcreteBoard8X8,
+    ConcreteBonusList,
+    ConcreteScore,
+    Coords,
+    Points,
+)
+from .game import ConcreteGame, Game
+from .rng import PieceRNG
+
+MAGIC = b"M3G\x01"
+
+FLAG_SEED = 1
+FLAG_RNG_STATE = 2
+
+_RNG_STATE = struct.Struct("<625I")
+
+
+class FormatError(Exception):
+    pass
+
+
+def write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(buf: memoryview, pos: int) -> tuple[int, int]:
+    """
+    возвращает значение и позицию после него
+    """
+    value = shift = 0
+    while True:
+        try:
+            byte = buf[pos]
+        except IndexError:
+            raise FormatError("Truncated varint") from None
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def pack_cells(codes: bytes) -> bytes:
+    """
+    3 бита на клетку: каждые 8 клеток - 3 байта
+    """
+    codes = codes + bytes(-len(codes) % 8)
+    out = bytearray()
+    for i in range(0, len(codes), 8):
+        group = 0
+        for j, code in enumerate(codes[i : i + 8]):
+            group |= code << (3 * j)
+        out += group.to_bytes(3, "little")
+    return bytes(out)
+
+
+def unpack_cells(data: memoryview, count: int) -> bytes:
+    out = bytearray()
+    for i in range(0, len(data), 3):
+        group = int.from_bytes(data[i : i + 3], "little")
+        out += bytes((group >> (3 * j)) & 7 for j in range(8))
+    return bytes(out[:count])
+
+
+def _packed_size(count: int) -> int:
+    return (count + 7) // 8 * 3
+
+
+def dumps_game(game: Game, include_rng_state: bool = True) -> bytes:
+    """
+    игра в виде одной записи (с полем длины)
+    """
+    board = game.get_game_board()
+    rng = board.get_rng()
+    rows, cols = board.get_rows(), board.get_cols()
+    seed = rng.get_seed()
+    if not isinstance(seed, int) or seed < 0:
+        # only non-negative integer seeds fit a varint
+        seed = None
+
+    flags = 0
+    if seed is not None:
+        flags |= FLAG_SEED
+    if include_rng_state:
+        flags |= FLAG_RNG_STATE
+
+    body = bytearray([flags])
+    write_varint(body, rows)
+    write_varint(body, cols)
+    body += pack_cells(board.dump_codes())
+    write_varint(body, game.get_game_score().get_points().value)
+
+    bonuses = game.get_game_bonus_list().get_bonuses()
+    write_varint(body, len(bonuses))
+    for bonus in bonuses:
+        name = type(bonus).__name__.encode()
+        write_varint(body, len(name))
+        body += name
+
+    if seed is not None:
+        write_varint(body, seed)
+    if include_rng_state:
+        _, words, _ = rng.get_state()
+        body += _RNG_STATE.pack(*words)
+
+    moves = game.get_move_log()
+    write_varint(body, len(moves))
+    for coord1, coord2 in moves:
+        write_varint(body, _encode_move(coord1, coord2, cols))
+
+    record = bytearray()
+    write_varint(record, len(body))
+    return bytes(record + body)
+
+
+def _encode_move(coord1: Coords, coord2: Coords, cols: int) -> int:
+    if coord2 < coord1:
+        coord1, coord2 = coord2, coord1
+    row, col = coord1
+    down = int(coord2[0] != row)
+    return (row * cols + col) << 1 | down
+
+
+def _decode_move(value: int, cols: int) -> tuple[Coords, Coords]:
+    row, col = divmod(value >> 1, cols)
+    if value & 1:
+        return (row, col), (row + 1, col)
+    return (row, col), (row, col + 1)
+
+
+class GameRecord:
+    """
+    класс реализации
+    запись игры в буфере; поля разбираются по запросу, без копирования
+    """
+
+    def __init__(self, buf: memoryview) -> None:
+        self._buf = buf
+        self._flags = buf[0]
+        self._rows, pos = read_varint(buf, 1)
+        self._cols, pos = read_varint(buf, pos)
+        self._cells_pos = pos
+        pos += _packed_size(self._rows * self._cols)
+        self._score, pos = read_varint(buf, pos)
+        count, pos = read_varint(buf, pos)
+        self._bonus_names: list[str] = []
+        for _ in range(count):
+            length, pos = read_varint(buf, pos)
+            self._bonus_names.append(bytes(buf[pos : pos + length]).decode())
+            pos += length
+        self._seed = None
+        if self._flags & FLAG_SEED:
+            self._seed, pos = read_varint(buf, pos)
+        self._rng_pos = None
+        if self._flags & FLAG_RNG_STATE:
+            self._rng_pos = pos
+            pos += _RNG_STATE.size
+        self._moves_pos = pos
+
+    # query
+    def get_size(self) -> tuple[int, int]:
+        return self._rows, self._cols
+
+    def get_score(self) -> int:
+        return self._score
+
+    def get_seed(self) -> int | None:
+        return self._seed
+
+    def get_codes(self) -> bytes:
+        count = self._rows * self._cols
+        start = self._cells_pos
+        return unpack_cells(self._buf[start : start + _packed_size(count)], count)
+
+    def get_rng_state(self) -> tuple | None:
+        if self._rng_pos is None:
+            return None
+        words = _RNG_STATE.unpack_from(self._buf, self._rng_pos)
+        return (3, words, None)
+
+    def iter_moves(self) -> Iterator[tuple[Coords, Coords]]:
+        count, pos = read_varint(self._buf, self._moves_pos)
+        for _ in range(count):
+            value, pos = read_varint(self._buf, pos)
+            yield _decode_move(value, self._cols)
+
+    def to_game(self) -> ConcreteGame:
+        """
+        восстановленная игра (доска, счёт, бонусы, генератор и журнал ходов)
+        """
+        rng = PieceRNG(self._seed)
+        if self._rows == self._cols == 8:
+            board = ConcreteBoard8X8(rng)
+        else:
+            board = CompactBoard(self._rows, self._cols, rng)
+        board.load_codes(self.get_codes())
+        board.mark_all_dirty()
+        # the board constructor draws from rng, so restore its state last
+        state = self.get_rng_state()
+        if state is not None:
+            rng.set_state(state)
+
+        score = ConcreteScore()
+        score.set_points(Points(self._score))
+        bonus_list = ConcreteBonusList()
+        bonus_types = {cls.__name__: cls for cls in _bonus_classes(Bonus)}
+        bonus_list.set_bonuses(tuple(bonus_types[n]() for n in self._bonus_names))
+
+        game = ConcreteGame(headless=True)
+        game.add_element(board)
+        game.add_element(score)
+        game.add_element(bonus_list)
+        for coord1, coord2 in self.iter_moves():
+            game.log_move(coord1, coord2)
+        return game
+
+
+def _bonus_classes(cls: type) -> list[type]:
+    result = []
+    for sub in cls.__subclasses__():
+        result.append(sub)
+        result.extend(_bonus_classes(sub))
+    return result
+
+
+def loads_game(data: bytes | memoryview) -> ConcreteGame:
+    records = iter_records(memoryview(data))
+    try:
+        return next(records).to_game()
+    except StopIteration:
+        raise FormatError("No game record") from None
+
+
+def iter_records(buf: memoryview) -> Iterator[GameRecord]:
+    """
+    последовательно разбирает записи из буфера
+    """
+    pos = 0
+    while pos < len(buf):
+        length, pos = read_varint(buf, pos)
+        if pos + length > len(buf):
+            raise FormatError("Truncated game record")
+        yield GameRecord(buf[pos : pos + length])
+        pos += length
+
+
+class GameArchiveWriter:
+    """
+    класс реализации
+    архив партий: заголовок и записи игр подряд
+    """
+
+    def __init__(self, path: str, include_rng_state: bool = False) -> None:
+        self._file = open(path, "ab")
+        self._include_rng_state = include_rng_state
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def write(self, game: Game) -> None:
+        self._file.write(dumps_game(game, self._include_rng_state))
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "GameArchiveWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def read_archive(path: str) -> Iterator[GameRecord]:
+    """
+    лениво читает архив через mmap: в память попадают
+    только страницы с разбираемыми записями
+    """
+    with open(path, "rb") as file:
+        if file.read(len(MAGIC)) != MAGIC:
+            raise FormatError(f"{path} is not a game archive")
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    # the mapping is released with the last record that still refers to it
+    yield from iter_records(memoryview(mapped)[len(MAGIC) :])
@@ -1,7 +1,29 @@
+import asyncio
+import io
+import os
+import tempfile
 import unittest
 
+from src import batch, bench, bitboard, matcher
+from src.async_game import AsyncGameLoop
+from src.loadgen import parse_frame, run_load
+from src.profiling import Instrumentation, profile_session
+from src.render import GLYPHS, TerminalRenderer
+from src.replay import ReplayRecorder, parse_log, read_log, replay_game, verify_files
+from src.server import GameServer, Session, SessionLimits
 from src.elements import *
 from src.game import *
+from src.moves import *
+from src.simulate import simulate
+from src.solver import Solver
+from src.stats import (
+    MoveSummary,
+    QuantileSketch,
+    StatsAggregator,
+    aggregate_simulation,
+    iter_replayed,
+)
+from src.storage import *
 
 
 class TestMatchThreeGame(unittest.TestCase):
@@ -73,5 +95,869 @@ class TestMatchThreeGame(unittest.TestCase):
         self.assertEqual(match_handler.process_matches_status(), 1)
 
 
+class TestCompactBoard(unittest.TestCase):
+
+    def test_piece_view(self):
+        board = CompactBoard(4)
+        piece = board.get_board_piece((1, 2))
+        piece.set_value(PieceEnum.C)
+        self.assertEqual(board.get_codes()[1 * 4 + 2], PieceEnum.C.value)
+        self.assertEqual(piece, board.get_board_piece((1, 2)))
+        piece.set_empty_value()
+        self.assertEqual(board.get_board_piece((1, 2))._value, PieceEnum.X)
+
+    def test_comb_handler(self):
+        board = CompactBoard(4)
+        for i, code in enumerate([1, 2, 1, 2, 3, 4, 3, 4, 1, 2, 1, 2, 4, 3, 4, 3]):
+            board.set_code(divmod(i, 4), code)
+        board.move((0, 0), (1, 0))
+        handler = CombHandler(board, ConcreteScore())
+        handler._find_combs()
+        self.assertFalse(handler.has_matches())
+        board.set_code((0, 1), 1)
+        board.set_code((0, 3), 1)
+        handler._find_combs()
+        self.assertEqual(
+            [comb.get_coords() for comb in handler._combs], [{(0, 1), (0, 2), (0, 3)}]
+        )
+
+    def test_dirty_lines(self):
+        board = CompactBoard(5)
+        for i in range(25):
+            row, col = divmod(i, 5)
+            board.set_code((row, col), 1 + (row + 2 * col) % 5)
+        handler = CombHandler(board, ConcreteScore())
+        handler.prepare_board()
+        self.assertEqual(board.pop_dirty_lines(), (set(), set()))
+        board._swap((2, 1), (2, 2))
+        self.assertEqual(board.pop_dirty_lines(), ({2}, {1, 2}))
+        board.set_code((4, 4), PieceEnum.A.value)
+        board.set_code((4, 3), PieceEnum.A.value)
+        board.set_code((4, 2), PieceEnum.A.value)
+        handler._find_combs()
+        self.assertEqual(
+            [comb.get_coords() for comb in handler._combs], [{(4, 2), (4, 3), (4, 4)}]
+        )
+        # unresolved combination stays dirty and is found again
+        handler._clear_combs()
+        handler._find_combs()
+        self.assertTrue(handler.has_matches())
+
+
+class TestMatcher(unittest.TestCase):
+
+    @unittest.skipUnless(matcher.HAS_NUMPY, "numpy is not installed")
+    def test_vectorized_same_as_loops(self):
+        board = CompactBoard(6)
+        for i in range(36):
+            board.set_code(divmod(i, 6), 1 + (i * 7 // 5) % 2)
+        loops = CombHandler(board, ConcreteScore(), vectorized=False)
+        vectorized = CombHandler(board, ConcreteScore(), vectorized=True)
+        loops._find_combs()
+        vectorized._find_combs()
+        self.assertTrue(loops.has_matches())
+        self.assertEqual(
+            [comb.get_coords() for comb in loops._combs],
+            [comb.get_coords() for comb in vectorized._combs],
+        )
+
+
+class TestHeadlessMove(unittest.TestCase):
+
+    def test_headless_cascade(self):
+        game = ConcreteGameFactory.create_new_game(headless=True)
+        board = game.get_game_board()
+        for i in range(64):
+            row, col = divmod(i, 8)
+            board.set_code((row, col), 1 + (row + 2 * col) % 5)
+        board.set_code((0, 1), PieceEnum.A.value)
+        cmd = CommandDispatcher("13,23", game).process_command()
+        cmd.execute()
+        steps = cmd.get_cascade()
+        self.assertEqual(steps[0].removed, {(0, 0), (0, 1), (0, 2)})
+        self.assertEqual(steps[0].shifted_cols, [0, 1, 2])
+        self.assertEqual(sorted(steps[0].refilled), [(0, 0), (0, 1), (0, 2)])
+        self.assertEqual(steps[0].points.value, 3)
+        self.assertEqual(
+            game.get_game_score()._score.value,
+            sum(step.points.value for step in steps),
+        )
+
+    def test_gravity_refills_only_top_cells(self):
+        board = CompactBoard(4, rng=PieceRNG(3))
+        handler = CombHandler(board, ConcreteScore(), headless=True)
+        column = [1, 0, 2, 0]
+        for row, code in enumerate(column):
+            board.set_code((row, 1), code)
+        handler._shift_elements()
+        self.assertEqual([board.get_code((r, 1)) for r in range(4)], [0, 0, 1, 2])
+        self.assertEqual(handler._replace_elements(), [(0, 1), (1, 1)])
+
+
+@unittest.skipUnless(matcher.HAS_NUMPY, "numpy is not installed")
+class TestBatchEngine(unittest.TestCase):
+
+    def test_matches_comb_handler(self):
+        seeds = [1, 2, 3, 4]
+        engine = batch.BatchEngine.from_seeds(seeds, 6, 7)
+        games = [
+            ConcreteGameFactory.create_new_game(True, seed, rows=6, cols=7)
+            for seed in seeds
+        ]
+        for _ in range(5):
+            swaps, expected = [], []
+            for game in games:
+                board = game.get_game_board()
+                move = generate_moves(board)[0]
+                swaps.append(move)
+                board.move(*move)
+                score = ConcreteScore()
+                steps = CombHandler(board, score, headless=True).process_combs()
+                expected.append((score.get_points().value, len(steps)))
+            result = engine.step(swaps)
+            self.assertEqual(
+                list(zip(result.points.tolist(), result.cascades.tolist())),
+                expected,
+            )
+            for i, game in enumerate(games):
+                board_codes = game.get_game_board().dump_codes()
+                self.assertEqual(engine.get_board_codes(i), board_codes)
+
+    def test_dead_boards_reshuffled(self):
+        # on 4x4 these seeds leave no legal move after prepare_board
+        seeds = [32, 41, 44]
+        engine = batch.BatchEngine.from_seeds(seeds, 4, 4)
+        for i, seed in enumerate(seeds):
+            game = ConcreteGameFactory.create_new_game(True, seed, rows=4, cols=4)
+            board_codes = game.get_game_board().dump_codes()
+            self.assertEqual(engine.get_board_codes(i), board_codes)
+
+    def test_skipped_board_is_unchanged(self):
+        engine = batch.BatchEngine.from_seeds([5, 6])
+        before = engine.get_board_codes(1)
+        move = generate_moves(CompactBoard(8))[0]
+        result = engine.step([move, None])
+        self.assertEqual(engine.get_board_codes(1), before)
+        self.assertEqual(result.cascades[1], 0)
+
+
+class TestMoveGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.board = CompactBoard(5)
+        for i in range(25):
+            row, col = divmod(i, 5)
+            self.board.set_code((row, col), 1 + (row + 2 * col) % 5)
+
+    def test_generate_moves(self):
+        self.assertEqual(generate_moves(self.board), [])
+        self.board.set_code((0, 1), PieceEnum.A.value)
+        self.assertEqual(generate_moves(self.board), [((0, 2), (1, 2))])
+        self.assertTrue(is_legal_swap(self.board, (1, 2), (0, 2)))
+        self.assertFalse(is_legal_swap(self.board, (0, 2), (0, 3)))
+        self.assertFalse(is_legal_swap(self.board, (0, 1), (1, 2)))
+
+    def test_index_update(self):
+        generator = MoveGenerator(self.board)
+        self.assertFalse(generator.has_moves())
+        self.board.set_code((0, 1), PieceEnum.A.value)
+        generator.update([(0, 1)])
+        self.assertTrue(generator.has_moves())
+        self.assertTrue(generator.is_legal((1, 2), (0, 2)))
+        handler = CombHandler(self.board, ConcreteScore(), headless=True)
+        self.board.move((0, 2), (1, 2))
+        steps = handler.process_combs()
+        generator.update_after_move(((0, 2), (1, 2)), steps)
+        self.assertEqual(generator.get_moves(), generate_moves(self.board))
+
+    def test_dead_board_reshuffle(self):
+        self.assertFalse(has_legal_moves(self.board))
+        # the cached answer is keyed by the position hash
+        dead = CompactBoard(5, rng=PieceRNG(7))
+        dead.load_codes(self.board.dump_codes())
+        self.assertFalse(has_legal_moves(dead))
+        reshuffle(dead)
+        self.assertTrue(has_legal_moves(dead))
+        board = ConcreteBoard8X8(PieceRNG(7))
+        move = reshuffle(board)
+        self.assertTrue(is_legal_swap(board, *move))
+        self.assertEqual(find_move(board), generate_moves(board)[0])
+        handler = CombHandler(board, ConcreteScore(), headless=True)
+        board.mark_all_dirty()
+        handler._find_combs()
+        self.assertFalse(handler.has_matches())
+
+    def test_reshuffle_narrow_boards(self):
+        for rows, cols in ((10, 2), (3, 2), (1, 9), (9, 1), (2, 3)):
+            game = ConcreteGameFactory.create_new_game(
+                headless=True, seed=5, rows=rows, cols=cols, compact=True
+            )
+            board = game.get_game_board()
+            self.assertTrue(is_legal_swap(board, *reshuffle(board)))
+        for rows, cols in ((2, 2), (1, 3), (3, 1)):
+            self.assertFalse(has_room_for_moves(rows, cols))
+            with self.assertRaises(ValueError):
+                ConcreteGameFactory.create_new_game(headless=True, rows=rows, cols=cols)
+
+
+class TestZobrist(unittest.TestCase):
+
+    def test_incremental_hash(self):
+        board = ConcreteBoard8X8(PieceRNG(2))
+        start, code = board.get_hash(), board.get_code((3, 3))
+        board._swap((0, 0), (0, 1))
+        board.set_code((3, 3), PieceEnum.X.value)
+        changed = board.get_hash()
+        board._rehash()
+        self.assertEqual(board.get_hash(), changed)
+        compact = CompactBoard(8, rng=PieceRNG(5))
+        compact.load_codes(board.dump_codes())
+        self.assertEqual(compact.get_hash(), changed)
+        board._swap((0, 0), (0, 1))
+        board.set_code((3, 3), code)
+        self.assertEqual(board.get_hash(), start)
+
+    def test_combination_hash(self):
+        comb = Combination({(0, 0), (0, 1), (0, 2)})
+        same = Combination([(0, 2), (0, 1), (0, 0)])
+        self.assertEqual(comb, same)
+        self.assertEqual(len({comb, same}), 1)
+        self.assertEqual({comb: 1}[same], 1)
+
+
+class TestSolver(unittest.TestCase):
+
+    def test_search(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=1)
+        board = game.get_game_board()
+        before = board.dump_codes()
+        solver = Solver(max_depth=2, samples=1)
+        result = solver.search(board)
+        self.assertEqual(board.dump_codes(), before)
+        self.assertTrue(is_legal_swap(board, *result.move))
+        self.assertEqual(result.depth, 2)
+        self.assertGreater(result.nodes, 0)
+        again = solver.search(board)
+        self.assertEqual(again.move, result.move)
+        self.assertEqual(again.nodes, 0)
+        self.assertEqual(solver.get_stats().searches, 2)
+
+    def test_hint_command(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=2)
+        cmd = CommandDispatcher("h", game).process_command()
+        self.assertIsInstance(cmd, HintCommand)
+        cmd.execute()
+        self.assertIsNotNone(cmd.get_result().move)
+
+
+class TestTerminalRenderer(unittest.TestCase):
+
+    def test_repaints_only_changed_cells(self):
+        board = CompactBoard(8, rng=PieceRNG(1))
+        out = io.StringIO()
+        renderer = TerminalRenderer(out)
+        renderer.draw(board, "Current Score: 0\n")
+        self.assertEqual(renderer.get_repainted(), 64)
+        self.assertIn("\033[2J", out.getvalue())
+
+        out.seek(0)
+        out.truncate()
+        code = 1 + board.get_code((2, 3)) % 5
+        board.set_code((2, 3), code)
+        renderer.draw(board, "Current Score: 0\n")
+        self.assertEqual(renderer.get_repainted(), 1)
+        frame = out.getvalue()
+        self.assertNotIn("\033[2J", frame)
+        line, column = board.get_cell_position((2, 3))
+        self.assertIn(f"\033[{line};{column}H{GLYPHS[code]}", frame)
+
+    def test_glyph_modes(self):
+        board = CompactBoard(10, 12, rng=PieceRNG(3))
+        board.set_code((9, 11), PieceEnum.X.value)
+        colored = board.format_frame()
+        # screen positions are checked without the escape codes
+        for mode in (GlyphMode.PLAIN, GlyphMode.COMPACT):
+            board.set_glyph_mode(mode)
+            self.assertEqual(board.get_glyphs(), GLYPH_TABLES[mode])
+            text = board.format_frame()
+            self.assertNotIn("\033", text)
+            lines = text.split("\n")
+            self.assertEqual(len(lines) - 1, board.get_frame_height())
+            for coord in ((0, 0), (4, 7), (9, 11)):
+                line, column = board.get_cell_position(coord)
+                glyph = board.get_glyphs()[board.get_code(coord)]
+                self.assertEqual(lines[line - 1][column - 1], glyph)
+        self.assertEqual(board.get_glyphs()[PieceEnum.X.value], ".")
+        board.set_glyph_mode(GlyphMode.PLAIN)
+        plain = board.format_frame()
+        for code, glyph in enumerate(GLYPHS):
+            colored = colored.replace(glyph, GLYPH_TABLES[GlyphMode.PLAIN][code])
+        self.assertEqual(colored, plain)
+        self.assertEqual(str(ConcretePiece(value=PieceEnum.B)), GLYPHS[2])
+
+
+class TestAsyncGameLoop(unittest.TestCase):
+
+    def test_concurrent_games(self):
+        async def play(seed: int) -> ConcreteGame:
+            game = ConcreteGameFactory.create_new_game(headless=True, seed=seed)
+            move = find_move(game.get_game_board())
+            commands = iter([",".join(map(format_coords, move)), "q"])
+
+            async def read_line() -> str | None:
+                await asyncio.sleep(0)
+                return next(commands, None)
+
+            loop = AsyncGameLoop(game, read_line, frame_delay=0.01, animate=False)
+            await loop.run()
+            return game
+
+        async def play_all() -> list[ConcreteGame]:
+            return await asyncio.gather(*(play(seed) for seed in (1, 2, 3)))
+
+        for seed, game in zip((1, 2, 3), asyncio.run(play_all())):
+            expected = ConcreteGameFactory.create_new_game(headless=True, seed=seed)
+            move = find_move(expected.get_game_board())
+            command = ",".join(map(format_coords, move))
+            CommandDispatcher(command, expected).process_command().execute()
+            self.assertEqual(
+                game.get_game_board().dump_codes(),
+                expected.get_game_board().dump_codes(),
+            )
+            self.assertEqual(game.get_move_log(), [move])
+
+    def test_quit_with_open_input(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=1)
+        reads = 0
+
+        async def read_line() -> str | None:
+            nonlocal reads
+            reads += 1
+            if reads == 1:
+                return "q"
+            # the input stays open: nothing more ever arrives
+            await asyncio.Event().wait()
+
+        async def play() -> None:
+            loop = AsyncGameLoop(game, read_line, frame_delay=0.01, animate=False)
+            await asyncio.wait_for(loop.run(), 1)
+
+        asyncio.run(play())
+        self.assertEqual(reads, 1)
+
+
+class TestGameServer(unittest.TestCase):
+
+    def test_session_protocol(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=4)
+        session = Session(game, SessionLimits(rate=1, burst=2))
+        score, board = parse_frame(session.frame())
+        self.assertEqual(board.dump_codes(), game.get_game_board().dump_codes())
+        self.assertTrue(session.handle("zz").startswith(b"err"))
+        move = ",".join(map(format_coords, find_move(board)))
+        self.assertTrue(session.handle(move).startswith(b"ok"))
+        self.assertEqual(game.get_move_log(), [find_move(board)])
+        frame = session.handle("binary")
+        self.assertEqual(frame[0], len(frame) - 1)
+        self.assertEqual(frame[1], 0)
+        self.assertIsNone(session.handle("q"))
+        self.assertTrue(session.allow(0.0))
+        self.assertTrue(session.allow(0.0))
+        self.assertFalse(session.allow(0.0))
+        self.assertTrue(session.allow(1.0))
+
+    def test_load(self):
+        async def serve_and_load():
+            server = GameServer(seed=1, limits=SessionLimits(rate=1000, burst=1000))
+            await server.start()
+            try:
+                report = await run_load("127.0.0.1", server.get_port(), 10, 3)
+            finally:
+                await server.close()
+            return report, server.get_stats()
+
+        report, stats = asyncio.run(serve_and_load())
+        self.assertEqual(report.to_dict()["errors"], 0)
+        self.assertEqual(report.to_dict()["commands"], 30)
+        self.assertEqual(stats.total_sessions, 10)
+
+
+class TestBonus(unittest.TestCase):
+
+    def test_combination_bonus(self):
+        self.assertIsNone(Combination({(0, 0), (0, 1), (0, 2)}).get_bonus())
+        row = Combination({(2, c) for c in range(4)}).get_bonus()
+        col = Combination({(r, 5) for r in range(4)}).get_bonus()
+        self.assertIsInstance(row, RowBonus)
+        self.assertIsInstance(col, ColumnBonus)
+        self.assertIsInstance(
+            Combination({(0, c) for c in range(5)}).get_bonus(), BombBonus
+        )
+        self.assertIsInstance(
+            Combination({(0, c) for c in range(6)}).get_bonus(), ColorBonus
+        )
+
+    def test_masks(self):
+        board = CompactBoard(5, 6, rng=PieceRNG(0))
+        board.load_codes(bytes(1 + (i % 5) for i in range(30)))
+        cases = [
+            (RowBonus(), (2, 3), {(2, c) for c in range(6)}),
+            (ColumnBonus(), (2, 3), {(r, 3) for r in range(5)}),
+            (BombBonus(), (0, 5), {(0, 4), (0, 5), (1, 4), (1, 5)}),
+            (ColorBonus(), (0, 0), {divmod(i, 6) for i in range(0, 30, 5)}),
+        ]
+        for bonus, coord, expected in cases:
+            mask = bytearray(30)
+            bonus.mark_cells(board, coord, mask)
+            self.assertEqual({divmod(i, 6) for i in range(30) if mask[i]}, expected)
+
+    def test_bonus_command(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=4)
+        bonus_list = game.get_game_bonus_list()
+        bonus_list.add_bouns(RowBonus())
+        bonus_list.add_bouns(BombBonus())
+        board = game.get_game_board()
+        cmd = CommandDispatcher("b1 45 b2 11", game).process_command()
+        self.assertIsInstance(cmd, BonusCommand)
+        cmd.execute()
+        self.assertIsNone(cmd.get_error())
+        first = cmd.get_cascade()[0]
+        # the row and the bomb are cleared together in one step
+        self.assertEqual(len(first.removed), 8 + 4)
+        self.assertEqual(first.points.value, 12)
+        self.assertNotIn(PieceEnum.X.value, board.get_codes())
+        self.assertFalse(
+            any(isinstance(b, BombBonus) for b in bonus_list.get_bonuses())
+        )
+
+        game.undo()
+        self.assertEqual(len(bonus_list.get_bonuses()), 2)
+        cmd = CommandDispatcher("b3 45", game).process_command()
+        cmd.execute()
+        self.assertEqual(cmd.get_error(), "No bonus 3")
+
+    def test_long_combination_awards_bonus(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=5)
+        bonus_list = game.get_game_bonus_list()
+        for _ in range(200):
+            move = find_move(game.get_game_board())
+            cmd = CommandDispatcher(",".join(map(format_coords, move)), game)
+            cmd.process_command().execute()
+            if bonus_list.get_bonuses():
+                break
+        self.assertTrue(bonus_list.get_bonuses())
+        game.undo()
+        self.assertFalse(bonus_list.get_bonuses())
+
+
+class TestBitboard(unittest.TestCase):
+
+    def _check_masks(self, board):
+        codes = board.dump_codes()
+        rows, cols = board.get_rows(), board.get_cols()
+        for code in range(ZOBRIST_CODES):
+            cells = bitboard.to_cell_bytes(board.get_color_mask(code), rows, cols)
+            self.assertEqual(cells, bytes(int(x == code) for x in codes))
+
+    def test_masks_follow_mutations(self):
+        for board in (
+            ConcreteBoard(5, 7, PieceRNG(1)),
+            CompactBoard(40, 40, PieceRNG(1)),
+        ):
+            self._check_masks(board)
+            self.assertEqual(
+                board.has_eager_bits(),
+                board.get_rows() * board.get_cols() < board.LAZY_BITS_MIN_CELLS,
+            )
+            board.move((0, 0), (0, 1))
+            board.set_code((2, 3), PieceEnum.X.value)
+            self._check_masks(board)
+            self.assertEqual(board.count_code(PieceEnum.X.value), 1)
+            handler = CombHandler(board, ConcreteScore(), headless=True)
+            handler.process_combs()
+            self._check_masks(board)
+
+    def test_piece_mutations_keep_board_in_sync(self):
+        for board in (ConcreteBoard8X8(PieceRNG(3)), CompactBoard(8, rng=PieceRNG(3))):
+            board.pop_dirty_lines()
+            piece = board.get_board_piece((2, 5))
+            piece.set_value(PieceEnum.X)
+            self.assertEqual(board.get_code((2, 5)), PieceEnum.X.value)
+            self.assertEqual(board.count_code(PieceEnum.X.value), 1)
+            self.assertEqual(board.pop_dirty_lines(), ({2}, {5}))
+            piece.set_random_value()
+            self._check_masks(board)
+            rehashed = board.get_hash()
+            board._rehash()
+            self.assertEqual(board.get_hash(), rehashed)
+
+    def test_runs_and_moves(self):
+        board = CompactBoard(3, 4, rng=PieceRNG(0))
+        board.load_codes(bytes([1, 1, 2, 1, 3, 4, 5, 3, 4, 5, 3, 4]))
+        # no run yet; moving the last 1 left completes the top row
+        self.assertEqual(board.get_match_mask(), 0)
+        targets = bitboard.move_targets(board.get_color_mask(1), 3, 4)
+        self.assertEqual(list(bitboard.iter_coords(targets, 4)), [(0, 2)])
+        self.assertTrue(has_legal_moves(board))
+        board.move((0, 2), (0, 3))
+        cells = list(bitboard.iter_coords(board.get_match_mask(), 4))
+        self.assertEqual(cells, [(0, 0), (0, 1), (0, 2)])
+
+    def test_legal_moves_agree_with_scan(self):
+        rng = PieceRNG(3)
+        for _ in range(200):
+            board = CompactBoard(4, 5, rng=PieceRNG(0))
+            board.load_codes(bytes(1 + rng.next_index(4) for _ in range(20)))
+            self.assertEqual(has_legal_moves(board), bool(generate_moves(board)))
+
+
+class TestReplay(unittest.TestCase):
+
+    def _record(self, path, seed, commands, close=True, rows=8, cols=8):
+        game = ConcreteGameFactory.create_new_game(
+            headless=True, seed=seed, rows=rows, cols=cols
+        )
+        recorder = ReplayRecorder(path, game)
+        game.set_recorder(recorder)
+        for command in commands:
+            if command == "move":
+                move = find_move(game.get_game_board())
+                command = ",".join(map(format_coords, move))
+            cmd = CommandDispatcher(command, game).process_command()
+            if not isinstance(cmd, InvalidCommand):
+                cmd.execute()
+        score = game.get_game_score().get_points().value
+        recorder.close(score if close else None)
+        return score
+
+    def test_replay_matches_recorded_game(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.log")
+            score = self._record(path, 11, ["move", "move", "u", "11,13", "move"])
+            self._record(path, 12, ["move", "zz", "move"], close=False)
+            logs = read_log(path)
+            self.assertEqual([log.seed for log in logs], [11, 12])
+            self.assertEqual(logs[0].score, score)
+            self.assertIsNone(logs[1].score)
+            self.assertEqual(len(logs[0].commands), 5)
+
+            result = replay_game(logs[0])
+            self.assertTrue(result.is_ok())
+            self.assertEqual(result.score, score)
+            other = os.path.join(tmp, "other.log")
+            self._record(other, 13, ["move"])
+            report = verify_files([path, other], workers=2)
+            self.assertTrue(report.is_ok())
+            self.assertEqual(report.to_dict()["games"], 3)
+
+    def test_board_size_from_game(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.log")
+            self._record(path, 14, ["move", "move"], rows=6, cols=11)
+            (log,) = read_log(path)
+            self.assertEqual((log.seed, log.rows, log.cols), (14, 6, 11))
+            self.assertTrue(replay_game(log).is_ok())
+            with self.assertRaises(ValueError):
+                ReplayRecorder(path, ConcreteGameFactory.create_new_game(True))
+
+    def test_tampered_log_fails(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "game.log")
+            self._record(path, 3, ["move", "move", "move"])
+            with open(path) as file:
+                lines = file.read().splitlines()
+            # claim more points before the last move
+            kind, score, command = lines[3].split(" ", 2)
+            lines[3] = f"{kind} {int(score) + 5} {command}"
+            result = replay_game(next(parse_log(lines)))
+            self.assertFalse(result.is_ok())
+            self.assertEqual(result.mismatch, 2)
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_phases_timed_only_while_enabled(self):
+        original = CombHandler._find_combs
+        stats = Instrumentation()
+        stats.enable()
+        try:
+            self.assertTrue(stats.is_enabled())
+            game = ConcreteGameFactory.create_new_game(headless=True, seed=3)
+            move = find_move(game.get_game_board())
+            cmd = CommandDispatcher(",".join(map(format_coords, move)), game)
+            cmd.process_command().execute()
+        finally:
+            stats.disable()
+        self.assertIs(CombHandler._find_combs, original)
+
+        summary = stats.summary()
+        timings = summary["timings"]
+        self.assertGreaterEqual(timings["ConcreteBoard.move"]["count"], 1)
+        self.assertEqual(
+            timings["CombHandler._remove_elements"]["count"],
+            timings["CombHandler._replace_elements"]["count"],
+        )
+        self.assertEqual(
+            summary["counters"]["removed_cells"], summary["counters"]["refilled_cells"]
+        )
+        self.assertEqual(
+            summary["counters"]["points"], game.get_game_score().get_points().value
+        )
+
+        handler = CombHandler(game.get_game_board(), ConcreteScore(), headless=True)
+        handler._find_combs()
+        self.assertEqual(stats.summary(), summary)
+
+    def test_profile_session(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "session.prof")
+            with profile_session(path):
+                simulate(1, max_moves=3)
+            self.assertGreater(os.path.getsize(path), 0)
+
+
+class TestPieceRNG(unittest.TestCase):
+
+    def test_draw(self):
+        codes = PieceRNG(1).draw(1000)
+        self.assertEqual(len(codes), 1000)
+        self.assertEqual(set(codes), {1, 2, 3, 4, 5})
+        self.assertEqual(codes, PieceRNG(1).draw(1000))
+
+    def test_replayable_game(self):
+        games = [ConcreteGameFactory.create_new_game(True, seed=5) for _ in range(2)]
+        for game in games:
+            board = game.get_game_board()
+            handler = CombHandler(board, game.get_game_score(), headless=True)
+            for _ in range(3):
+                board.move(*generate_moves(board)[0])
+                handler.process_combs()
+        first, second = games
+        self.assertEqual(
+            first.get_game_board().get_codes(), second.get_game_board().get_codes()
+        )
+        self.assertEqual(
+            first.get_game_score()._score.value, second.get_game_score()._score.value
+        )
+
+
+class TestUndo(unittest.TestCase):
+
+    def test_undo_move(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=3)
+        board = game.get_game_board()
+        before = board.dump_codes()
+        row, col = generate_moves(board)[0][0]
+        row2, col2 = generate_moves(board)[0][1]
+        cmd = CommandDispatcher(f"{row + 1}{col + 1},{row2 + 1}{col2 + 1}", game)
+        cmd.process_command().execute()
+        self.assertNotEqual(board.dump_codes(), before)
+        self.assertGreater(game.get_game_score().get_points().value, 0)
+        CommandDispatcher("u", game).process_command().execute()
+        self.assertEqual(board.dump_codes(), before)
+        self.assertEqual(game.get_game_score().get_points().value, 0)
+        # nothing left to undo
+        CommandDispatcher("u", game).process_command().execute()
+        self.assertEqual(board.dump_codes(), before)
+
+    def test_undo_bonus_keeps_move_log(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=3)
+        board = game.get_game_board()
+        for _ in range(2):
+            move = ",".join(map(format_coords, find_move(board)))
+            CommandDispatcher(move, game).process_command().execute()
+        moves, after_moves = list(game.get_move_log()), board.dump_codes()
+        game.get_game_bonus_list().add_bouns(BombBonus())
+        CommandDispatcher("b1 33", game).process_command().execute()
+        self.assertNotEqual(board.dump_codes(), after_moves)
+        CommandDispatcher("u", game).process_command().execute()
+        self.assertEqual(board.dump_codes(), after_moves)
+        self.assertEqual(game.get_move_log(), moves)
+        CommandDispatcher("u", game).process_command().execute()
+        self.assertEqual(game.get_move_log(), moves[:1])
+
+    def test_bounded_history(self):
+        history = ConcreteHistory(max_states=2)
+        for points in range(3):
+            history.add_state(State(b"", points, ()))
+        self.assertEqual(history.get_last_state().score, 2)
+        history.undo()
+        history.undo()
+        self.assertIsNone(history.get_last_state())
+
+    def test_load_codes(self):
+        board = CompactBoard(4, rng=PieceRNG(1))
+        target = CompactBoard(4, rng=PieceRNG(2)).dump_codes()
+        board.pop_dirty_lines()
+        board.load_codes(target)
+        self.assertEqual(board.dump_codes(), target)
+
+
+class TestStorage(unittest.TestCase):
+
+    def make_game(self, seed):
+        game = ConcreteGameFactory.create_new_game(headless=True, seed=seed)
+        board = game.get_game_board()
+        handler = CombHandler(board, game.get_game_score(), headless=True)
+        for _ in range(3):
+            move = generate_moves(board)[0]
+            game.log_move(*move)
+            board.move(*move)
+            handler.process_combs()
+        return game
+
+    def assertSameGame(self, first, second):
+        self.assertEqual(
+            first.get_game_board().dump_codes(), second.get_game_board().dump_codes()
+        )
+        self.assertEqual(
+            first.get_game_score().get_points().value,
+            second.get_game_score().get_points().value,
+        )
+        self.assertEqual(first.get_move_log(), second.get_move_log())
+
+    def test_cells_packing(self):
+        codes = bytes([0, 1, 2, 3, 4, 5, 5, 4, 3, 2, 1])
+        packed = pack_cells(codes)
+        self.assertEqual(len(packed), 6)
+        self.assertEqual(unpack_cells(memoryview(packed), len(codes)), codes)
+
+    def test_dumps_loads(self):
+        game = self.make_game(1)
+        loaded = loads_game(dumps_game(game))
+        self.assertSameGame(game, loaded)
+        self.assertEqual(
+            game.get_game_board().get_rng().draw(10),
+            loaded.get_game_board().get_rng().draw(10),
+        )
+
+    def test_archive(self):
+        games = [self.make_game(seed) for seed in range(3)]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with GameArchiveWriter(path) as writer:
+            for game in games:
+                writer.write(game)
+        records = read_archive(path)
+        for game, record in zip(games, records, strict=True):
+            self.assertSameGame(game, record.to_game())
+
+
+class TestBench(unittest.TestCase):
+
+    def test_run_benchmarks(self):
+        report = bench.run_benchmarks(bench.default_scenarios((8,)), min_time=0)
+        names = {result["name"] for result in report["results"]}
+        self.assertTrue({"find_combs", "resolve_move"} <= names)
+        self.assertTrue(all(r["ops_per_sec"] > 0 for r in report["results"]))
+        self.assertEqual(len(bench.compare_results(report, report)), len(names))
+
+
+class TestRectangularBoard(unittest.TestCase):
+
+    def test_parse_coords(self):
+        self.assertEqual(parse_coords("12"), (0, 1))
+        self.assertEqual(parse_coords(" 10:12"), (9, 11))
+        self.assertEqual(parse_coords("3.14"), (2, 13))
+        self.assertEqual(parse_coords("10 2"), (9, 1))
+        self.assertIsNone(parse_coords("123"))
+        self.assertIsNone(parse_coords("a:1"))
+
+    def test_rectangular_game(self):
+        for compact in (False, True):
+            game = ConcreteGameFactory.create_new_game(
+                headless=True, seed=2, rows=6, cols=14, compact=compact
+            )
+            board = game.get_game_board()
+            self.assertEqual((board.get_rows(), board.get_cols()), (6, 14))
+            handler = CombHandler(board, ConcreteScore(), headless=True)
+            handler._find_combs()
+            self.assertFalse(handler.has_matches())
+            (row, col), (row2, col2) = max(generate_moves(board), key=lambda m: m[1])
+            cmd = CommandDispatcher(f"{row + 1}:{col + 1},{row2 + 1}:{col2 + 1}", game)
+            cmd = cmd.process_command()
+            cmd.execute()
+            self.assertTrue(cmd.get_cascade())
+            self.assertEqual(len(game.get_move_log()), 1)
+
+    def test_out_of_board(self):
+        game = ConcreteGameFactory.create_new_game(headless=True, rows=4, cols=12)
+        cmd = CommandDispatcher("5:1,5:2", game).process_command()
+        cmd.execute()
+        self.assertIsNone(cmd.get_cascade())
+
+
+class TestSimulate(unittest.TestCase):
+
+    def test_same_results_for_seed(self):
+        single = simulate(4, policy="greedy", master_seed=7, max_moves=5)
+        pooled = simulate(
+            4, policy="greedy", master_seed=7, workers=2, max_moves=5, chunk_size=1
+        )
+        self.assertEqual(single.get_results(), pooled.get_results())
+        report = single.to_dict()
+        self.assertEqual(report["games"], 4)
+        self.assertEqual(sum(report["cascade_depth"].values()), 4 * 5)
+
+
+class TestStats(unittest.TestCase):
+
+    def test_merge_matches_single_pass(self):
+        single = aggregate_simulation(6, master_seed=5, max_moves=10)
+        pooled = aggregate_simulation(
+            6, master_seed=5, workers=2, max_moves=10, chunk_size=2
+        )
+        self.assertEqual(single.to_dict(), pooled.to_dict())
+        report = single.to_dict()
+        scores = [
+            r.score for r in simulate(6, master_seed=5, max_moves=10).get_results()
+        ]
+        self.assertEqual(report["games"], 6)
+        self.assertEqual(report["moves"], 60)
+        self.assertEqual(report["score"]["max"], max(scores))
+        points = sum(item["points"] for item in report["combinations"].values())
+        self.assertEqual(points, sum(scores))
+
+    def test_quantile_sketch(self):
+        values = list(range(1, 10001))
+        left, right = QuantileSketch(), QuantileSketch()
+        for value in values:
+            (left if value % 2 else right).add(value)
+        left.merge(right)
+        self.assertEqual(left.get_count(), len(values))
+        for q in (0.5, 0.9, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLess(abs(left.quantile(q) - exact), 0.01 * exact + 1)
+        with self.assertRaises(ValueError):
+            left.merge(QuantileSketch(accuracy=0.05))
+
+    def test_replay_skips_undone_moves(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "games.log")
+            game = ConcreteGameFactory.create_new_game(headless=True, seed=21)
+            recorder = ReplayRecorder(path, game)
+            game.set_recorder(recorder)
+            board = game.get_game_board()
+            for command in ("move", "move", "u", "u", "move", "u", "u", "move"):
+                if command == "move":
+                    command = ",".join(map(format_coords, find_move(board)))
+                CommandDispatcher(command, game).process_command().execute()
+            score = game.get_game_score().get_points().value
+            recorder.close(score)
+
+            events = list(iter_replayed([path]))
+        moves = [e for e in events if isinstance(e, MoveSummary)]
+        self.assertEqual(events[-1].moves, 1)
+        self.assertEqual(len(moves), 1)
+        self.assertEqual(sum(move.points for move in moves), score)
+        self.assertEqual(events[-1].score, score)
+
+    def test_empty(self):
+        report = StatsAggregator().to_dict()
+        self.assertEqual(report["games"], 0)
+        self.assertEqual(report["score"], {"count": 0})
+
+
 if __name__ == "__main__":
     unittest.main()